@@ -0,0 +1,694 @@
+"""Micro-benchmarks for the quiz parser and engine.
+
+Run ``python bench.py`` to run every benchmark, or ``python bench.py NAME``
+to run one of them.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+import zipfile
+
+import quiz
+
+QUESTION_PREFIX = "Question Prefix,NO."
+ANSWER_PREFIX = "Answer:"
+
+def option_prefixes(count):
+    """Return the first count option prefixes (A., B., ...)."""
+    return [f"{chr(65 + i)}." for i in range(count)]
+
+def sample_lines(option_count, repeat=2000):
+    """Build a list of stripped lines shaped like a real bank."""
+    block = [f"{QUESTION_PREFIX} 1 Which of these is correct?", "continued question text"]
+    block += [f"{prefix} option text" for prefix in option_prefixes(option_count)]
+    block += [f"{ANSWER_PREFIX} A", ""]
+    return block * repeat
+
+def rate(count, seconds):
+    """Format a throughput figure."""
+    return f"{count / seconds:>14,.0f}/s"
+
+def bench_classify():
+    """Lines/sec for the startswith chain versus the compiled classifier."""
+
+    def startswith_chain(line, prefixes):
+        if line.startswith(QUESTION_PREFIX):
+            return quiz.QUESTION_LINE
+        if any(line.startswith(prefix) for prefix in prefixes):
+            return quiz.OPTION_LINE
+        if line.startswith(ANSWER_PREFIX):
+            return quiz.ANSWER_LINE
+        return None
+
+    for count in (4, 10, 26):
+        prefixes = option_prefixes(count)
+        lines = sample_lines(count)
+        classify = quiz.compile_line_classifier(QUESTION_PREFIX, prefixes, ANSWER_PREFIX)
+
+        start = time.perf_counter()
+        before = [startswith_chain(line, prefixes) for line in lines]
+        chain_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        after = [classify(line) for line in lines]
+        compiled_time = time.perf_counter() - start
+
+        assert before == after
+        print(f"{count:>2} option prefixes: startswith {rate(len(lines), chain_time)}"
+              f" | compiled {rate(len(lines), compiled_time)}")
+
+def write_docx(path, question_count):
+    """Write a synthetic .docx bank, starting from an empty python-docx document."""
+    import docx
+
+    docx.Document().save(path)
+    with zipfile.ZipFile(path) as archive:
+        parts = {name: archive.read(name) for name in archive.namelist()}
+
+    body = []
+    for i in range(question_count):
+        lines = [f"{QUESTION_PREFIX} {i} Which of these is correct?"]
+        lines += [f"{prefix} option text" for prefix in option_prefixes(4)]
+        lines += [f"{ANSWER_PREFIX} A", ""]
+        body += [f'<w:p><w:r><w:t xml:space="preserve">{line}</w:t></w:r></w:p>' for line in lines]
+    parts['word/document.xml'] = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+        + ''.join(body) + '</w:body></w:document>').encode('utf-8')
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+
+def peak_rss_mb():
+    """Return the peak resident memory of this process in MB (Linux reports KB)."""
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def docx_baseline():
+    """Peak memory of a worker process that only imports the parsers."""
+    import docx  # noqa: F401
+
+    return peak_rss_mb(), 0
+
+def docx_streamed(path):
+    """Count paragraph lines with the streaming reader."""
+    with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as document:
+        count = sum(1 for _ in quiz.iter_docx_lines(document))
+    return peak_rss_mb(), count
+
+def docx_python_docx(path):
+    """Count paragraphs after loading the whole document with python-docx."""
+    import docx
+
+    count = len(docx.Document(path).paragraphs)
+    return peak_rss_mb(), count
+
+def bench_docx():
+    """Peak memory of the streaming .docx reader versus a python-docx Document load."""
+    path = os.path.join(tempfile.mkdtemp(), "bank.docx")
+    write_docx(path, 15000)  # About 2,000 pages of questions
+    print(f"{os.path.getsize(path) / 1048576:.1f} MB .docx, {15000 * 7:,} paragraphs")
+
+    context = multiprocessing.get_context('spawn')
+    for name, function, args in (("baseline", docx_baseline, ()),
+                                 ("iterparse", docx_streamed, (path,)),
+                                 ("python-docx", docx_python_docx, (path,))):
+        # A fresh process per reader, so each peak is measured on its own
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            start = time.perf_counter()
+            peak, count = pool.submit(function, *args).result()
+            seconds = time.perf_counter() - start
+        print(f"{name:>12}: peak {peak:7.1f} MB, {count:>6} paragraphs, {seconds:.2f}s")
+
+BANK_COLUMNS = ('text', 'string_offsets', 'record_index', 'answers', 'answer_offsets', 'answer_masks')
+
+def write_bank_file(path, question_count, option_count=4):
+    """Write a synthetic text bank mixing inline answers and a trailing answer key."""
+    with open(path, 'w') as file:
+        for i in range(question_count):
+            file.write(f"{QUESTION_PREFIX} {i} Which of these is correct?\n")
+            for prefix in option_prefixes(option_count):
+                file.write(f"{prefix} option text\n")
+            file.write(f"{ANSWER_PREFIX} A\n\n" if i % 2 else "\n")
+        for i in range(0, question_count, 2):
+            file.write(f"{i + 1}. B\n")
+
+def bench_parallel():
+    """Questions/sec for a sequential parse versus chunked parsing across processes."""
+    path = os.path.join(tempfile.mkdtemp(), "bank.txt")
+    write_bank_file(path, 1_000_000)
+    prefixes = option_prefixes(4)
+    print(f"{os.path.getsize(path) / 1048576:.0f} MB, 1,000,000 questions, {os.cpu_count()} CPUs")
+
+    start = time.perf_counter()
+    with open(path) as file:
+        expected = quiz.parse_question_lines(file, QUESTION_PREFIX, prefixes, ANSWER_PREFIX)
+    sequential = time.perf_counter() - start
+    print(f"  sequential: {rate(len(expected), sequential)}")
+
+    for workers in (1, 2, 4, 8):
+        start = time.perf_counter()
+        questions = quiz.parse_questions_parallel(path, QUESTION_PREFIX, prefixes, ANSWER_PREFIX, workers=workers)
+        seconds = time.perf_counter() - start
+        assert all(getattr(questions, name) == getattr(expected, name) for name in BANK_COLUMNS)
+        print(f"  {workers} workers: {rate(len(questions), seconds)} ({sequential / seconds:.2f}x)")
+    os.remove(path)
+
+def bench_memory():
+    """Bytes per question held by a list of dicts versus a QuestionBank."""
+    import tracemalloc
+
+    path = os.path.join(tempfile.mkdtemp(), "bank.txt")
+    write_bank_file(path, 100_000)
+    prefixes = option_prefixes(4)
+
+    def parse_dicts():
+        answer_map = {}
+        with open(path) as file:
+            return list(quiz.iter_questions(file, QUESTION_PREFIX, prefixes, ANSWER_PREFIX, answer_map))
+
+    def parse_bank():
+        with open(path) as file:
+            return quiz.parse_question_lines(file, QUESTION_PREFIX, prefixes, ANSWER_PREFIX)
+
+    for name, parse in (("list of dicts", parse_dicts), ("QuestionBank", parse_bank)):
+        tracemalloc.start()
+        questions = parse()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{name:>14}: {held / len(questions):7.1f} bytes/question")
+        del questions
+    os.remove(path)
+
+def current_rss_mb():
+    """Return the private and file-backed resident memory of this process in MB (Linux only).
+
+    File-backed pages of a mapping are page cache the OS can drop at will.
+    """
+    with open('/proc/self/statm') as file:
+        resident, shared = (int(field) for field in file.read().split()[1:3])
+    page = os.sysconf('SC_PAGE_SIZE') / 1048576
+    return (resident - shared) * page, shared * page
+
+def compile_bank_file(text_path, bank_path):
+    """Parse a text bank and write it as a compiled bank file."""
+    with open(text_path) as file:
+        quiz.write_bank(bank_path, quiz.parse_question_lines(file, QUESTION_PREFIX, option_prefixes(4), ANSWER_PREFIX))
+
+def read_mapped_bank(bank_path, reads):
+    """Open a mapped bank, read random questions and return the resident memory it cost."""
+    import random
+
+    private, mapped = current_rss_mb()
+    bank = quiz.MappedQuestionBank(bank_path)
+    for question_id in random.sample(range(len(bank)), reads):
+        bank.prefetch([question_id])
+        bank[question_id]
+    after_private, after_mapped = current_rss_mb()
+    return after_private - private, after_mapped - mapped
+
+def bench_mapped():
+    """Resident memory of a mapped bank after reading questions, by bank size."""
+    context = multiprocessing.get_context('spawn')
+    directory = tempfile.mkdtemp()
+    for count in (10_000, 100_000, 1_000_000):
+        text_path = os.path.join(directory, f"{count}.txt")
+        bank_path = os.path.join(directory, f"{count}.qbank")
+        write_bank_file(text_path, count)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            pool.submit(compile_bank_file, text_path, bank_path).result()
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            private, mapped = pool.submit(read_mapped_bank, bank_path, 2000).result()
+        print(f"{count:>9,} questions, {os.path.getsize(bank_path) / 1048576:6.1f} MB bank: after 2,000 random reads "
+              f"{private:5.1f} MB private, {mapped:5.1f} MB of mapped pages")
+        os.remove(text_path)
+        os.remove(bank_path)
+
+def bench_order():
+    """Time to pick the first 50 questions of a 200k bank: full shuffle versus a lazy order."""
+    import random
+
+    count, asked = 200_000, 50
+    start = time.perf_counter()
+    ids = list(range(count))
+    random.shuffle(ids)
+    ids[:asked]
+    shuffle_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    order = quiz.ShuffledOrder(count, seed=1)
+    order[:asked]
+    lazy_time = time.perf_counter() - start
+    print(f"random.shuffle {shuffle_time * 1000:8.2f} ms | ShuffledOrder {lazy_time * 1000:8.3f} ms")
+
+def rebuild_question(app, position):
+    """Show a question the old way, destroying and recreating every widget."""
+    import tkinter as tk
+
+    app.session.position = position
+    for widget in app.question_frame.winfo_children():
+        widget.destroy()
+    question_data = app.session.bank[app.session.current()]
+    tk.Label(app.question_frame, text=question_data['question'], wraplength=550, font=("Arial", 14), bg="#f0f0f0", anchor="w").pack(pady=10)
+    check_vars = []
+    for option in question_data['options']:
+        var = tk.BooleanVar()
+        tk.Checkbutton(app.question_frame, text=option, variable=var, bg="#f0f0f0").pack(anchor=tk.W, pady=5)
+        check_vars.append(var)
+
+def bench_next():
+    """Next-to-painted latency: rebuilding the question widgets, the recycled pool, and a full submit.
+
+    A submit (grade, inline feedback, next question) should fit in one 16 ms frame. The
+    counters show how many Configure events and stat changes were coalesced; before,
+    each of them reconfigured the scroll region or a label on its own. The page timings
+    split the work into building a question page during idle time and swapping it in.
+    """
+    import array
+    import statistics
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"skipped, Tk needs a display: {e}")
+        return
+
+    lines = []
+    for i in range(2000):
+        lines.append(f"{QUESTION_PREFIX} {i} Which of these is correct?")
+        lines += [f"{prefix} option text {i}" for prefix in option_prefixes(2 + i % 7)]
+        lines += [f"{ANSWER_PREFIX} A", ""]
+    bank = quiz.parse_question_lines(lines, QUESTION_PREFIX, option_prefixes(8), ANSWER_PREFIX)
+
+    def pooled(app, position):
+        app.session.position = position
+        app.load_question()
+
+    def submit(app, position):
+        app.check_answer()  # Answers the previous question and moves on to this one
+
+    for name, show in (("rebuild", rebuild_question), ("pooled", pooled), ("submit", submit)):
+        app = quiz.QuizApp(root)
+        app.start_quiz(bank, array.array('Q', range(len(bank))))
+        timings = []
+        for position in range(1, len(bank)):
+            start = time.perf_counter()
+            show(app, position)
+            root.update()  # Geometry, redraw and the resulting Configure events, as after a click
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        counts = app.event_counts
+        print(f"{name:>8}: median {statistics.median(timings) * 1000:6.2f} ms, "
+              f"p95 {timings[int(len(timings) * 0.95)] * 1000:6.2f} ms over {len(timings)} questions | "
+              f"{counts['configure']} Configure events -> {counts['scroll_region']} scroll region updates, "
+              f"{counts['stats_changes']} stat changes -> {counts['stats_updates']} label updates")
+        for timing, histogram in sorted(app.metrics.histograms.items()):
+            print(f"{'':>10}{timing}: p50 {histogram.percentile(50) / 1e6:6.3f} ms over {histogram.count}")
+        root.unbind("<Key>")
+        root.unbind("<Return>")
+        for widget in root.winfo_children():
+            widget.destroy()
+    root.destroy()
+
+def bench_review():
+    """Redraw time and canvas item count of the review list while scrolling 100,000 answers."""
+    import array
+    import random
+    import statistics
+    import tkinter as tk
+    import tkinter.font as tkfont
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"skipped, Tk needs a display: {e}")
+        return
+
+    path = os.path.join(tempfile.mkdtemp(), "bank.txt")
+    write_bank_file(path, 100_000)
+    with open(path) as file:
+        bank = quiz.parse_question_lines(file, QUESTION_PREFIX, option_prefixes(4), ANSWER_PREFIX)
+    os.remove(path)
+    selections = array.array('Q', (random.getrandbits(4) for _ in range(len(bank))))
+
+    root.geometry("700x500")
+    review = quiz.ReviewList(root, bank, range(len(bank)), selections, tkfont.Font(root=root, family="Arial", size=12))
+    root.update()
+    timings = []
+    for _ in range(500):
+        start = time.perf_counter()
+        review.yview("moveto", random.random())
+        root.update_idletasks()
+        timings.append(time.perf_counter() - start)
+    print(f"{len(selections):,} rows: median {statistics.median(timings) * 1000:.2f} ms per jump, "
+          f"{len(review.canvas.find_all())} canvas items")
+    root.destroy()
+
+def bench_session():
+    """Simulated answers/sec through a headless QuizSession: plain, with a listener, and with partial credit."""
+    import array
+    import random
+
+    bank = quiz.parse_question_lines(sample_lines(4, 100_000), QUESTION_PREFIX, option_prefixes(4), ANSWER_PREFIX)
+    order = array.array('Q', range(len(bank)))
+    masks = [random.getrandbits(4) for _ in range(len(bank))]
+    events = []
+
+    for name, listener, policy in (("no listener", None, quiz.all_or_nothing),
+                                   ("listener", lambda event, *args: events.append(event), quiz.all_or_nothing),
+                                   ("partial", None, quiz.partial_credit)):
+        session = quiz.QuizSession(bank, order, policy)
+        if listener:
+            session.subscribe(listener)
+        session.start()
+        submit = session.submit
+        start = time.perf_counter()
+        for mask in masks:
+            submit(mask)
+        seconds = time.perf_counter() - start
+        assert session.attempted == len(bank) and session.current() is None
+        print(f"{name:>12}: {rate(len(masks), seconds)} answers, score {session.score:,}, {session.points:,.1f} points")
+        events.clear()
+
+def bench_journal():
+    """Resume time for a 2,000-answer session over a compiled 200k-question bank."""
+    import random
+
+    directory = tempfile.mkdtemp()
+    text_path = os.path.join(directory, "bank.txt")
+    bank_path = os.path.join(directory, "bank.qbank")
+    journal_path = os.path.join(directory, "session.journal")
+    write_bank_file(text_path, 200_000)
+    compile_bank_file(text_path, bank_path)
+    settings = {'filename': text_path, 'question_prefix': QUESTION_PREFIX,
+                'option_prefixes': option_prefixes(4), 'answer_prefix': ANSWER_PREFIX}
+
+    bank = quiz.MappedQuestionBank(bank_path)
+    session = quiz.QuizSession(bank, quiz.ShuffledOrder(len(bank), seed=7))
+    journal = quiz.SessionJournal.create(journal_path, settings, 7, None, None, len(bank))
+    session.subscribe(journal.on_session_event)
+    start = time.perf_counter()
+    for i in range(2000):
+        session.submit(random.getrandbits(4))
+        if i % 100 == 99:
+            journal.flush()  # The UI flushes on a timer; about every 100 answers in a fast drill
+    journal.close()
+    write_time = time.perf_counter() - start
+    print(f"journaled 2,000 answers with 20 fsyncs in {write_time * 1000:.1f} ms, "
+          f"{os.path.getsize(journal_path):,} bytes")
+
+    start = time.perf_counter()
+    header, answers = quiz.read_journal(journal_path)
+    resumed = quiz.QuizSession(quiz.MappedQuestionBank(bank_path), quiz.ShuffledOrder(header['length'], header['seed'], header['first']))
+    resumed.replay(zip(answers[::2], answers[1::2]))
+    resume_time = time.perf_counter() - start
+    assert (resumed.position, resumed.score, resumed.selections) == (session.position, session.score, session.selections)
+    print(f"resumed at question {resumed.position + 1:,} in {resume_time * 1000:.2f} ms, no parse")
+    for path in (text_path, bank_path, journal_path):
+        os.remove(path)
+
+def bench_schedule():
+    """Due queue build and review rate over a 200k-card store, against a linear scan for the next card."""
+    import random
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bank.cards")
+    count = 200_000
+    store = quiz.CardStore.open(path, count)
+    now = quiz.now_minutes()
+    generator = random.Random(3)
+    for question_id in range(count):
+        if question_id % 4:  # A quarter of the cards are still new
+            store.update(question_id, now + generator.randrange(-30 * quiz.MINUTES_PER_DAY, 60 * quiz.MINUTES_PER_DAY),
+                         quiz.MINUTES_PER_DAY, quiz.SM2_START_EASE, 2)
+    store.close()
+    print(f"{count:,} cards in {os.path.getsize(path):,} bytes")
+
+    start = time.perf_counter()
+    store = quiz.CardStore.open(path, count)
+    scheduler = quiz.ReviewScheduler(store)
+    order = quiz.ReviewOrder(scheduler, now, seed=1)
+    build_time = time.perf_counter() - start
+    print(f"opened the store and built the due queue in {build_time * 1000:.1f} ms, {len(order):,} cards due")
+
+    session = quiz.QuizSession(quiz.QuestionBank(), order)
+    session.bank.answer_masks = [1] * count  # Grading reads nothing else, so skip building 200k records
+    session.subscribe(order.on_session_event)
+    reviews = 20_000
+    start = time.perf_counter()
+    for _ in range(reviews):
+        session.submit(1 if generator.random() < 0.85 else 2)
+    heap_time = time.perf_counter() - start
+    print(f"heap:        {rate(reviews, heap_time)} reviews, {len(order) - session.position:,} still due")
+
+    due = store.due
+    start = time.perf_counter()
+    for _ in range(20):
+        min((value, question_id) for question_id, value in enumerate(due) if value)
+    scan_time = (time.perf_counter() - start) / 20
+    print(f"linear scan: {rate(1, scan_time)} picks of the next card")
+    store.close()
+    os.remove(path)
+
+def bench_adaptive():
+    """Time to pick the most informative of 200k questions, with NumPy and with the plain loop."""
+    import random
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bank.cards")
+    count = 200_000
+    store = quiz.CardStore.open(path, count)
+    generator = random.Random(5)
+    for question_id in range(count):
+        store.difficulty[question_id] = generator.gauss(0, 1.5)
+
+    model = quiz.EloRatingModel(store, seed=1)
+    order = quiz.AdaptiveOrder(model, 200)
+    session = quiz.QuizSession(quiz.QuestionBank(), order)
+    session.bank.answer_masks = [1] * count  # Grading reads nothing else, so skip building 200k records
+    session.subscribe(order.on_session_event)
+    timings = []
+    while session.current() is not None:
+        start = time.perf_counter()
+        order[session.position + 1:session.position + 2]  # A fresh pick at the new ability, as prefetching does
+        timings.append(time.perf_counter() - start)
+        session.submit(1 if generator.random() < model.probability(session.current()) else 2)
+    timings.sort()
+    label = "numpy" if quiz.numpy is not None else "numpy missing"
+    print(f"{label:<12} median {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms per pick, ability {store.ability:+.2f}")
+
+    numpy, quiz.numpy = quiz.numpy, None
+    start = time.perf_counter()
+    for _ in range(5):
+        model.select(order.generated)
+    print(f"plain loop   {(time.perf_counter() - start) / 5 * 1000:.2f} ms per pick")
+    quiz.numpy = numpy
+    store.close()
+    os.remove(path)
+
+def result_records(numpy, count):
+    """Zeroed results log records in the layout of quiz.RESULT_RECORD, all from shuffled sessions."""
+    return numpy.zeros(count, numpy.dtype({'names': ['student', 'item', 'mask', 'mode'],
+                                           'formats': ['<u4', '<u4', '<u8', 'u1'], 'offsets': [0, 4, 8, 16],
+                                           'itemsize': quiz.RESULT_RECORD.size}))
+
+def bench_items():
+    """Item analysis of a 10,000 students x 5,000 questions results log."""
+    import numpy
+
+    students, questions = 10_000, 5_000
+    directory = tempfile.mkdtemp()
+    text_path = os.path.join(directory, "bank.txt")
+    results_path = os.path.join(directory, "bank.results")
+    write_bank_file(text_path, questions)
+    bank = quiz.parse_questions(text_path, QUESTION_PREFIX, option_prefixes(4), ANSWER_PREFIX)
+
+    # Answers drawn from a Rasch model, wrong ones spread over the other options
+    generator = numpy.random.default_rng(11)
+    ability = generator.normal(0, 1, (students, 1)).astype(numpy.float32)
+    difficulty = generator.normal(0, 1, questions).astype(numpy.float32)
+    right = generator.random((students, questions), numpy.float32) < 1 / (1 + numpy.exp(difficulty - ability))
+    key = numpy.log2(numpy.asarray(bank.answer_masks, numpy.float64)).astype(numpy.int64)
+    choice = numpy.where(right, key, (key + generator.integers(1, 4, (students, questions))) % 4)
+    records = result_records(numpy, students * questions)
+    records['student'] = numpy.repeat(numpy.arange(students), questions)
+    records['item'] = numpy.tile(numpy.arange(questions), students)
+    records['mask'] = (1 << choice).ravel()
+    del right, choice
+    with open(results_path, 'wb') as file:
+        file.write(quiz.RESULTS_HEADER.pack(quiz.RESULTS_MAGIC, quiz.RESULTS_VERSION, 1))
+        records.tofile(file)
+    del records
+    print(f"{students * questions:,} responses, {os.path.getsize(results_path) / 1048576:,.0f} MB log")
+
+    start = time.perf_counter()
+    responses = quiz.read_results(results_path)
+    read_time = time.perf_counter() - start
+    start = time.perf_counter()
+    stats = quiz.item_analysis(bank, *quiz.select_results(*responses))
+    analysis_time = time.perf_counter() - start
+    start = time.perf_counter()
+    flagged = quiz.flag_items(bank, stats)
+    flag_time = time.perf_counter() - start
+    print(f"read {read_time:.2f} s, analysed {analysis_time:.2f} s, flagged {len(flagged):,} in {flag_time:.2f} s, "
+          f"peak RSS {peak_rss_mb():,.0f} MB")
+    for path in (text_path, results_path):
+        os.remove(path)
+
+def bench_grade():
+    """Sheets/sec grading 50,000 CSV answer sheets of 100 questions, in one process versus a pool."""
+    sheets, questions = 50_000, 100
+    directory = tempfile.mkdtemp()
+    text_path = os.path.join(directory, "bank.txt")
+    sheets_path = os.path.join(directory, "sheets.csv")
+    write_bank_file(text_path, questions)
+    bank = quiz.parse_questions(text_path, QUESTION_PREFIX, option_prefixes(4), ANSWER_PREFIX)
+    generator = random.Random(23)
+    with open(sheets_path, 'w', newline='') as file:
+        file.write("student," + ",".join(f"Q{i + 1}" for i in range(questions)) + "\n")
+        for student in range(sheets):
+            file.write(f"{student:06d}," + ",".join(generator.choice("ABCD") for _ in range(questions)) + "\n")
+    print(f"{sheets:,} sheets of {questions} questions, {os.path.getsize(sheets_path) / 1048576:.1f} MB, "
+          f"{os.cpu_count()} CPUs")
+
+    for workers in (1, 2, 4):
+        scores = []
+        start = time.perf_counter()
+        with open(sheets_path, newline='') as file:
+            count, _ = quiz.grade_sheets(bank, file, scores.extend, workers=workers)
+        seconds = time.perf_counter() - start
+        assert count == len(scores) == sheets
+        print(f"  {workers} workers: {count / seconds:,.0f} sheets/sec")
+    for path in (text_path, sheets_path):
+        os.remove(path)
+
+def bench_rescore():
+    """Scoring a 5,000 students x 2,000 questions results log in one pass, then rescoring after 10 key fixes."""
+    import numpy
+
+    students, questions = 5_000, 2_000
+    directory = tempfile.mkdtemp()
+    text_path = os.path.join(directory, "bank.txt")
+    results_path = os.path.join(directory, "bank.results")
+    write_bank_file(text_path, questions)
+    bank = quiz.parse_questions(text_path, QUESTION_PREFIX, option_prefixes(4), ANSWER_PREFIX)
+    generator = numpy.random.default_rng(24)
+    records = result_records(numpy, students * questions)
+    records['student'] = numpy.repeat(numpy.arange(students), questions)
+    records['item'] = numpy.tile(numpy.arange(questions), students)
+    records['mask'] = generator.integers(0, 16, len(records))
+    with open(results_path, 'wb') as file:
+        file.write(quiz.RESULTS_HEADER.pack(quiz.RESULTS_MAGIC, quiz.RESULTS_VERSION, 1))
+        records.tofile(file)
+    del records
+    fixed = list(bank.answer_masks)
+    for question_id in range(0, questions, questions // 10):
+        fixed[question_id] = 3  # A and B
+
+    for name in quiz.ARRAY_SCORING_POLICIES:
+        start = time.perf_counter()
+        scores, _, _ = quiz.rescore_results(bank, results_path, name)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        _, changed, rescored = quiz.rescore_results(types.SimpleNamespace(answer_masks=fixed), results_path, name)
+        seconds = time.perf_counter() - start
+        print(f"  {name:>14}: {scores.records:,} scored in {build:.2f} s, "
+              f"{rescored:,} for {changed} fixed keys in {seconds * 1000:.0f} ms")
+        os.remove(quiz.scores_path(results_path, name))
+    for path in (text_path, results_path):
+        os.remove(path)
+
+def run_server(path, port, ready):
+    bank = quiz.parse_questions(path, QUESTION_PREFIX, option_prefixes(4), ANSWER_PREFIX)
+    server = quiz.QuizServer(bank)
+    asyncio.run(server.serve("127.0.0.1", port, lambda listening: ready.set()))
+
+async def http_request(reader, writer, method, path, body=b""):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+    return json.loads(await reader.readexactly(length))
+
+async def drive_sessions(port, connections, sessions_each, answers_each, rate, latencies):
+    """Answer through each connection's sessions in turn, at rate answers/sec in all, with random gaps."""
+    async def client(generator):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        names = [(await http_request(reader, writer, "POST", "/sessions", b'{"count": 50}'))["session"]
+                 for _ in range(sessions_each)]
+        for _ in range(answers_each):
+            for name in names:
+                await asyncio.sleep(generator.expovariate(rate / connections))
+                start = time.perf_counter_ns()
+                await http_request(reader, writer, "POST", f"/sessions/{name}/answer", b'{"answer": "B"}')
+                latencies.append(time.perf_counter_ns() - start)
+        writer.close()
+
+    await asyncio.gather(*(client(random.Random(i)) for i in range(connections)))
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    stats = await http_request(reader, writer, "GET", "/stats")
+    writer.close()
+    return stats
+
+def bench_serve():
+    """Request latency of one server holding 5,000 sessions, answered over 500 connections with random pauses."""
+    path = os.path.join(tempfile.mkdtemp(), "bank.txt")
+    write_bank_file(path, 200_000)
+    port = 8799
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=run_server, args=(path, port, ready), daemon=True)
+    server.start()
+    ready.wait()
+    try:
+        connections, sessions_each, answers_each, rate = 500, 10, 2, 2000
+        latencies = []
+        start = time.perf_counter()
+        stats = asyncio.run(drive_sessions(port, connections, sessions_each, answers_each, rate, latencies))
+        seconds = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.join()
+    latencies.sort()
+    requests = stats["requests"]
+    print(f"{stats['sessions']:,} sessions, {len(latencies):,} answers in {seconds:.1f} s "
+          f"({len(latencies) / seconds:,.0f}/sec, client and server sharing {os.cpu_count()} CPUs)")
+    print(f"  server: p50 {requests['p50_ns'] / 1e6:.3f} ms, p99 {requests['p99_ns'] / 1e6:.3f} ms, "
+          f"max {requests['max_ns'] / 1e6:.2f} ms")
+    print(f"  client round trip: p50 {latencies[len(latencies) // 2] / 1e6:.2f} ms, "
+          f"p99 {latencies[len(latencies) * 99 // 100] / 1e6:.2f} ms")
+    os.remove(path)
+
+BENCHMARKS = {
+    "adaptive": bench_adaptive,
+    "classify": bench_classify,
+    "docx": bench_docx,
+    "grade": bench_grade,
+    "items": bench_items,
+    "journal": bench_journal,
+    "mapped": bench_mapped,
+    "order": bench_order,
+    "memory": bench_memory,
+    "next": bench_next,
+    "parallel": bench_parallel,
+    "rescore": bench_rescore,
+    "review": bench_review,
+    "schedule": bench_schedule,
+    "serve": bench_serve,
+    "session": bench_session,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name}")
+        BENCHMARKS[name]()
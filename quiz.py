@@ -1,62 +1,128 @@
-import tkinter as tk
-from tkinter import messagebox, filedialog, Scrollbar, Canvas
+from array import array
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from contextlib import contextmanager
+import argparse
+import asyncio
+import csv
+import hashlib
+import heapq
+import json
+import math
+import io
+import locale
+import multiprocessing
+import mmap
+import os
+import platform
+import queue
 import random
 import re
+import shutil
+import struct
+import sys
+import threading
+import time
+import zipfile
 
-def load_questions(filename, question_prefix, option_prefixes, answer_prefix):
-    """Load questions from a specified file, parsing them based on provided prefixes."""
-    with open(filename, 'r') as file:
-        lines = file.readlines()
+try:
+    import tkinter as tk
+    from tkinter import messagebox, filedialog, Scrollbar, Canvas
+    import tkinter.font as tkfont
+except ImportError:  # Headless: grading, analysis and the server don't need Tk
+    tk = messagebox = filedialog = Scrollbar = Canvas = tkfont = None
 
-    questions = []
-    answer_map = {}
+try:
+    from PyPDF2 import PdfReader
+except ImportError:  # PDF import is optional
+    PdfReader = None
 
-    # Parse answers if they're provided separately in the file
-    for line in lines:
-        line = line.strip()
-        if re.match(r'^\d+\.\s*[A-Z]', line):
-            number, answer = line.split('.', 1)
-            answer_map[int(number.strip())] = answer.strip()
+try:
+    from lxml import etree
+except ImportError:  # DOCX import is optional
+    etree = None
+
+try:
+    import numpy
+except ImportError:  # Adaptive selection falls back to a plain loop
+    numpy = None
+
+ANSWER_KEY_PATTERN = re.compile(r'^\d+\.\s*[A-Z]')
+PROGRESS_INTERVAL = 256  # Records parsed between progress reports
+LOAD_POLL_MS = 50  # How often the UI checks on a background load
+FEEDBACK_DELAY_MS = 1200  # How long answer feedback stays up when pausing before the next question
+DEFAULT_QUESTION_PREFIX = "Question Prefix,NO."
+DEFAULT_OPTION_PREFIXES = "A., B., C., D."
+DEFAULT_ANSWER_PREFIX = "Answer:"
 
+# Line tags returned by the compiled classifier
+QUESTION_LINE, OPTION_LINE, ANSWER_LINE = 1, 2, 3
+
+def compile_line_classifier(question_prefix, option_prefixes, answer_prefix):
+    """Compile the prefixes into one anchored regex that tags a line in a single match.
+
+    The returned function maps a stripped line to QUESTION_LINE, OPTION_LINE,
+    ANSWER_LINE or None. The alternatives are tried in that order, which keeps
+    the precedence of the original chain of startswith checks.
+    """
+    # An empty prefix list never matches, unlike an empty prefix which always does
+    options = '|'.join(re.escape(prefix) for prefix in option_prefixes) if option_prefixes else '(?!)'
+    pattern = re.compile(f'({re.escape(question_prefix)})|({options})|({re.escape(answer_prefix)})')
+    match = pattern.match
+
+    def classify(line):
+        tag = match(line)
+        return tag.lastindex if tag else None
+
+    return classify
+
+def iter_questions(file, question_prefix, option_prefixes, answer_prefix, answer_map):
+    """Yield question records from an iterable of lines in a single pass.
+
+    Answer key lines (e.g. "12. AC") are collected into answer_map as they are
+    seen. Records without an inline answer are yielded with an empty answer,
+    since the key is usually at the end of the file; the caller resolves them
+    once the file has been read. Each record also carries 'line', the line
+    number its question starts on, for reporting problems with it.
+    """
+    classify = compile_line_classifier(question_prefix, option_prefixes, answer_prefix)
+    match_answer_key = ANSWER_KEY_PATTERN.match
     question_text = []
     options = []
     question = False
+    question_line = 0
 
-    for line in lines:
+    for line_number, line in enumerate(file, 1):
         line = line.strip()
+        # Collect answers if they're provided separately in the file
+        if match_answer_key(line):
+            number, answer = line.split('.', 1)
+            answer_map[int(number.strip())] = answer.strip()
+
+        kind = classify(line)
         # Check for a question line
-        if line.startswith(question_prefix):
+        if kind == QUESTION_LINE:
             if question:
-                questions.append({
-                    'question': ' '.join(question_text), 
-                    'options': options, 
-                    'answer': answer_map.get(len(questions) + 1, '')
-                })
+                yield {'question': ' '.join(question_text), 'options': options, 'answer': '', 'line': question_line}
                 question_text = []
                 options = []
             question = True
+            question_line = line_number
             question_text.append(line[len(question_prefix):].strip())
         # Check for options
-        elif question and any(line.startswith(prefix) for prefix in option_prefixes):
+        elif question and kind == OPTION_LINE:
             options.append(line)
         # Check for answers with a new format
-        elif question and line.startswith(answer_prefix):
+        elif question and kind == ANSWER_LINE:
             answer = line.split(": ")[1].strip()
-            questions.append({
-                'question': ' '.join(question_text), 
-                'options': options, 
-                'answer': answer
-            })
+            yield {'question': ' '.join(question_text), 'options': options, 'answer': answer, 'line': question_line}
             question_text = []
             options = []
             question = False
         # Check for blank lines to finalize a question
         elif question and line == "":
-            questions.append({
-                'question': ' '.join(question_text), 
-                'options': options, 
-                'answer': answer_map.get(len(questions) + 1, '')
-            })
+            yield {'question': ' '.join(question_text), 'options': options, 'answer': '', 'line': question_line}
             question_text = []
             options = []
             question = False
@@ -65,15 +131,530 @@ def load_questions(filename, question_prefix, option_prefixes, answer_prefix):
             question_text.append(line)
 
     if question_text:
-        questions.append({
-            'question': ' '.join(question_text), 
-            'options': options, 
-            'answer': answer_map.get(len(questions) + 1, '')
-        })
+        yield {'question': ' '.join(question_text), 'options': options, 'answer': '', 'line': question_line}
+
+INVALID_ANSWER = 1 << 63  # Mask of an answer that no selection of options can match
+NEGATIVE_MARK = 0.25  # Taken off for a wrong answer under negative marking, so guessing among 5 options gains nothing
+ANSWER_SEPARATOR_PATTERN = re.compile(r'[\s,;/&+.()]+|\band\b', re.IGNORECASE)
+
+def answer_mask(answer):
+    """Pack an answer into a bitmask with bit i set for option chr(65 + i).
+
+    The letters may run together ("AC"), be separated by punctuation or
+    spaces ("A, C") or by "and" ("a and c"), in either case. Grading is then
+    one compare with the mask of the selected options. An answer that isn't
+    a list of distinct letters gets INVALID_ANSWER; an empty one gets 0.
+    """
+    letters = ANSWER_SEPARATOR_PATTERN.sub('', answer).upper()
+    if not letters:
+        return INVALID_ANSWER if answer.strip() else 0
+
+    mask = 0
+    for letter in letters:
+        bit = ord(letter) - 65
+        if not 0 <= bit < 26 or mask >> bit & 1:
+            return INVALID_ANSWER
+        mask |= 1 << bit
+    return mask
+
+def all_or_nothing(selected, correct):
+    """Full credit for exactly the right options, none otherwise."""
+    return 1.0 if selected == correct else 0.0
+
+def partial_credit(selected, correct):
+    """A share of the credit for each right option picked, less one share per wrong pick, at least 0."""
+    if correct == INVALID_ANSWER or not correct:
+        return all_or_nothing(selected, correct)
+    right = (selected & correct).bit_count()
+    wrong = (selected & ~correct).bit_count()
+    return max(right - wrong, 0) / correct.bit_count()
+
+def subset_credit(selected, correct):
+    """A share of the credit for each right option picked, but nothing if any wrong one is."""
+    if correct == INVALID_ANSWER or not correct or selected & ~correct:
+        return all_or_nothing(selected, correct)
+    return selected.bit_count() / correct.bit_count()
+
+def negative_marking(selected, correct):
+    """Full credit for exactly the right options, NEGATIVE_MARK off for any other answer, nothing for a blank."""
+    if selected == correct:
+        return 1.0
+    if not selected or correct == INVALID_ANSWER:
+        return 0.0  # An ungradable question costs nothing
+    return -NEGATIVE_MARK
+
+SCORING_POLICIES = {
+    'all-or-nothing': all_or_nothing,
+    'partial': partial_credit,
+    'subset': subset_credit,
+    'negative': negative_marking,
+}
+
+def _append_offset(offsets, value):
+    """Append to a 32-bit offset array, returning it widened to 64 bits once value doesn't fit."""
+    if value > 0xFFFFFFFF and offsets.typecode == 'I':
+        offsets = array('Q', offsets)
+    offsets.append(value)
+    return offsets
+
+class QuestionBank:
+    """Columnar store of question records, indexed by integer id.
+
+    Question and option text lives in one UTF-8 buffer. string_offsets holds
+    the boundaries of every string in it and record_index the first string of
+    each record: the question, followed by its options. Answers are kept as
+    text for display and as option bitmasks for grading. Records are decoded
+    into dicts like the ones iter_questions yields only when they are read.
+    Offsets are 32-bit until a buffer outgrows 4 GB. line_numbers, kept while
+    parsing, holds the line each question starts on (0 if unknown) and
+    problems the answers validate_answers found that can't be graded. A bank
+    sampled from a file has source_ids, the id each question has in the
+    whole file.
+    """
+
+    problems = ()
+    source_ids = None
+
+    def __init__(self):
+        self.text = bytearray()
+        self.string_offsets = array('I', [0])
+        self.record_index = array('I', [0])
+        self.answers = bytearray()
+        self.answer_offsets = array('I', [0])
+        self.answer_masks = array('Q')
+        self.line_numbers = array('I')
+
+    @classmethod
+    def from_questions(cls, questions):
+        """Build a bank from record dicts."""
+        bank = cls()
+        for question in questions:
+            bank.append(question)
+        return bank
+
+    def __len__(self):
+        return len(self.answer_masks)
+
+    def __getitem__(self, question_id):
+        """Decode one record into a dict."""
+        return {
+            'question': self.question(question_id),
+            'options': self.options(question_id),
+            'answer': self.answer(question_id),
+        }
+
+    def __iter__(self):
+        for question_id in range(len(self)):
+            yield self[question_id]
+
+    def string(self, index):
+        """Decode one question or option string."""
+        return str(self.text[self.string_offsets[index]:self.string_offsets[index + 1]], 'utf-8')
+
+    def question(self, question_id):
+        """Return the text of a question."""
+        return self.string(self.record_index[question_id])
+
+    def options(self, question_id):
+        """Return the option lines of a question."""
+        return [self.string(index) for index in range(self.record_index[question_id] + 1, self.record_index[question_id + 1])]
+
+    def option_count(self, question_id):
+        """Return the number of options of a question without decoding them."""
+        return self.record_index[question_id + 1] - self.record_index[question_id] - 1
+
+    def answer(self, question_id):
+        """Return the answer of a question as written in the file."""
+        return str(self.answers[self.answer_offsets[question_id]:self.answer_offsets[question_id + 1]], 'utf-8')
+
+    def prefetch(self, question_ids):
+        """Prepare records that are about to be read; an in-memory bank has nothing to do."""
+
+    def append(self, question):
+        """Add a record dict to the end of the bank."""
+        for string in [question['question'], *question['options']]:
+            self.text += string.encode('utf-8')
+            self.string_offsets = _append_offset(self.string_offsets, len(self.text))
+        self.record_index = _append_offset(self.record_index, len(self.string_offsets) - 1)
+        self.answers += question['answer'].encode('utf-8')
+        self.answer_offsets = _append_offset(self.answer_offsets, len(self.answers))
+        self.answer_masks.append(answer_mask(question['answer']))
+        self.line_numbers.append(question.get('line', 0))
+
+    def extend(self, other, line_base=0):
+        """Add the records of another bank to the end of this one.
+
+        line_base is added to the other bank's line numbers, for a bank parsed
+        from a later part of the same file.
+        """
+        text_base, string_base, answer_base = len(self.text), len(self.string_offsets) - 1, len(self.answers)
+        self.text += other.text
+        self.answers += other.answers
+        for name, base in (('string_offsets', text_base), ('record_index', string_base), ('answer_offsets', answer_base)):
+            offsets = getattr(self, name)
+            added = getattr(other, name)
+            if offsets.typecode == 'I' and base + added[-1] > 0xFFFFFFFF:
+                offsets = array('Q', offsets)
+            offsets.extend(offset + base for offset in added[1:])
+            setattr(self, name, offsets)
+        self.answer_masks.extend(other.answer_masks)
+        self.line_numbers.extend(line + line_base if line else 0 for line in other.line_numbers)
+
+    def resolve_answers(self, answer_map):
+        """Fill in empty answers from an answer key numbered from 1 in file order."""
+        missing = {number - 1: answer for number, answer in answer_map.items()
+                   if 0 < number <= len(self) and self.answer_offsets[number - 1] == self.answer_offsets[number]}
+        if not missing:
+            return
+
+        answers = bytearray()
+        answer_offsets = array('I', [0])
+        for question_id in range(len(self)):
+            if question_id in missing:
+                answers += missing[question_id].encode('utf-8')
+                self.answer_masks[question_id] = answer_mask(missing[question_id])
+            else:
+                answers += self.answers[self.answer_offsets[question_id]:self.answer_offsets[question_id + 1]]
+            answer_offsets = _append_offset(answer_offsets, len(answers))
+        self.answers = answers
+        self.answer_offsets = answer_offsets
+
+    def validate_answers(self):
+        """Return (line, question_id, message) for each answer that can't be graded as written."""
+        problems = []
+        for question_id, mask in enumerate(self.answer_masks):
+            option_count = self.option_count(question_id)
+            if mask and not mask >> option_count:
+                continue  # Distinct letters, each naming an option the question has
+
+            answer = self.answer(question_id)
+            if not answer:
+                message = "has no answer"
+            elif mask == INVALID_ANSWER:
+                message = f"answer {answer!r} is not a list of option letters"
+            else:
+                message = f"answer {answer!r} names an option past the {option_count} the question has"
+            line = self.line_numbers[question_id] if question_id < len(self.line_numbers) else 0
+            problems.append((line, question_id, message))
+        return problems
+
+    def stats(self):
+        """Return the record count and option statistics stored in a bank header."""
+        counts = [self.option_count(question_id) for question_id in range(len(self))]
+        return {
+            'records': len(self),
+            'strings': len(self.string_offsets) - 1,
+            'options': sum(counts),
+            'min_options': min(counts, default=0),
+            'max_options': max(counts, default=0),
+            'text_size': len(self.text),
+            'answer_size': len(self.answers),
+        }
+
+def parse_question_lines(lines, question_prefix, option_prefixes, answer_prefix, on_progress=None, position=None):
+    """Parse an iterable of lines into a QuestionBank in order, resolving the answer key.
+
+    on_progress, if given, is called with position() (the bytes read so far)
+    and the bank parsed so far after every PROGRESS_INTERVAL records.
+    """
+    bank = QuestionBank()
+    answer_map = {}
+
+    for question in iter_questions(lines, question_prefix, option_prefixes, answer_prefix, answer_map):
+        bank.append(question)
+        if on_progress and len(bank) % PROGRESS_INTERVAL == 0:
+            on_progress(position(), bank)
+
+    # Fill in answers given in a separate answer key
+    bank.resolve_answers(answer_map)
+    bank.problems = bank.validate_answers()
+    return bank
+
+@contextmanager
+def open_question_lines(filename, question_prefix, option_prefixes, answer_prefix, on_pages=None):
+    """Open a text, PDF or DOCX question file as an iterable of lines.
+
+    Yields the lines and a function returning how many bytes of the file have
+    been read. on_pages is passed on to extract_pdf_pages.
+    """
+    if filename.lower().endswith('.pdf'):
+        pages = extract_pdf_pages(filename, on_pages=on_pages)
+        classify = compile_line_classifier(question_prefix, option_prefixes, answer_prefix)
+        size = os.path.getsize(filename)
+        yield stitch_pdf_pages(pages, classify), lambda: size
+
+    elif filename.lower().endswith('.docx'):
+        with zipfile.ZipFile(filename) as archive, archive.open('word/document.xml') as document:
+            # Progress is measured in compressed bytes read from the archive
+            yield iter_docx_lines(document), archive.fp.tell
+
+    else:
+        with open(filename, 'r') as file:
+            yield file, file.buffer.tell
+
+def parse_questions(filename, question_prefix, option_prefixes, answer_prefix, on_progress=None, on_pages=None):
+    """Parse a text, PDF or DOCX question file into a QuestionBank in file order.
 
-    for i, question in enumerate(questions):
-        if 'answer' not in question or not question['answer']:
-            question['answer'] = answer_map.get(i + 1, '')
+    on_progress is passed on to parse_question_lines and on_pages to
+    extract_pdf_pages.
+    """
+    if (not filename.lower().endswith(('.pdf', '.docx')) and os.path.getsize(filename) >= PARALLEL_PARSE_THRESHOLD
+            and (os.cpu_count() or 1) > 1):
+        bank = parse_questions_parallel(filename, question_prefix, option_prefixes, answer_prefix, on_progress)
+        if bank is not None:
+            return bank
+
+    with open_question_lines(filename, question_prefix, option_prefixes, answer_prefix, on_pages) as (lines, position):
+        return parse_question_lines(lines, question_prefix, option_prefixes, answer_prefix, on_progress, position)
+
+# Large text files are split into chunks that are parsed in separate processes
+PARALLEL_PARSE_THRESHOLD = 32 * 1024 * 1024  # Smallest file worth the process start-up cost
+PARSE_CHUNK_SIZE = 4 * 1024 * 1024  # Smallest chunk handed to a worker
+
+def find_chunk_boundaries(filename, question_prefix, encoding, chunk_size, split_on_blank=True):
+    """Return byte offsets that split a question file into chunks of about chunk_size.
+
+    A chunk starts at a question line or, with split_on_blank, just after a
+    blank line. The parser holds no pending question at either point, so each
+    chunk can be parsed on its own and the results concatenated. Blank lines
+    are only safe when no empty prefix makes them options or answers.
+    """
+    prefix = question_prefix.encode(encoding)
+    size = os.path.getsize(filename)
+    boundaries = [0]
+
+    with open(filename, 'rb') as file:
+        target = chunk_size
+        while target < size:
+            file.seek(target)
+            file.readline()  # Skip to the start of the next line
+            while True:
+                position = file.tell()
+                line = file.readline().strip()
+                if not line and position < size and split_on_blank:
+                    position = file.tell()  # Split after the blank line
+                    break
+                if position >= size or line.startswith(prefix):
+                    break
+            if position >= size:
+                break
+            boundaries.append(position)
+            target = position + chunk_size
+
+    boundaries.append(size)
+    return boundaries
+
+def parse_question_chunk(filename, start, end, encoding, question_prefix, option_prefixes, answer_prefix):
+    """Parse one byte range of a question file; runs in a worker process.
+
+    Returns the records as a QuestionBank, with answers from the answer key
+    still unresolved and line numbers counted from the start of the range,
+    the answer key lines found in the range, and its number of lines.
+    """
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    answer_map = {}
+    lines = io.StringIO(data.decode(encoding), newline=None)  # Universal newlines, as open() does
+    bank = QuestionBank.from_questions(iter_questions(lines, question_prefix, option_prefixes, answer_prefix, answer_map))
+    line_count = data.count(b'\n') + data.count(b'\r') - data.count(b'\r\n')
+    return bank, answer_map, line_count
+
+def parse_questions_parallel(filename, question_prefix, option_prefixes, answer_prefix, on_progress=None, workers=None):
+    """Parse a large text question file across a process pool.
+
+    Returns None when the file's encoding can't be split on newline bytes,
+    in which case the caller should parse it sequentially.
+    """
+    encoding = locale.getpreferredencoding(False)  # What open() uses by default
+    if '\n'.encode(encoding) != b'\n' or ' '.encode(encoding) != b' ':
+        return None
+
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(filename)
+    chunk_size = max(PARSE_CHUNK_SIZE, size // (workers * 4))
+    classify = compile_line_classifier(question_prefix, option_prefixes, answer_prefix)
+    boundaries = find_chunk_boundaries(filename, question_prefix, encoding, chunk_size, classify('') is None)
+
+    bank = QuestionBank()
+    answer_map = {}
+    line_base = 0  # Lines in the chunks merged so far
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        tasks = [executor.submit(parse_question_chunk, filename, start, end, encoding,
+                                 question_prefix, option_prefixes, answer_prefix)
+                 for start, end in zip(boundaries, boundaries[1:])]
+        # Merge in file order so the answer key numbering matches a sequential parse
+        for task, end in zip(tasks, boundaries[1:]):
+            chunk_bank, chunk_answers, line_count = task.result()
+            bank.extend(chunk_bank, line_base)
+            answer_map.update(chunk_answers)
+            line_base += line_count
+            if on_progress:
+                on_progress(end, bank)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+    bank.resolve_answers(answer_map)
+    bank.problems = bank.validate_answers()
+    return bank
+
+# Text extracted from PDF pages is cached per page, so re-imports skip extraction
+PDF_PAGE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".quizapp", "pages")
+PDF_PAGE_CACHE_LIMIT = 64 * 1024 * 1024  # Bytes kept before the pages of the least recently used PDFs are evicted
+PDF_PAGES_PER_TASK = 8  # Pages extracted by a worker process per task
+
+def prune_pdf_page_cache(cache_dir=PDF_PAGE_CACHE_DIR, limit=PDF_PAGE_CACHE_LIMIT, keep=None):
+    """Evict the pages of the least recently used PDFs until the cache fits in limit bytes, sparing keep's."""
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if entry.is_dir():
+            size = sum(page.stat().st_size for page in os.scandir(entry.path))
+            total += size
+            if entry.path != keep:
+                entries.append((entry.stat().st_mtime, size, entry.path))
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def extract_pdf_page_texts(filename, page_numbers):
+    """Extract the text of some pages of a PDF; runs in a worker process."""
+    reader = PdfReader(filename)
+    return [(number, reader.pages[number].extract_text() or '') for number in page_numbers]
+
+def extract_pdf_pages(filename, cache_dir=PDF_PAGE_CACHE_DIR, on_pages=None, workers=None):
+    """Extract the text of every page of a PDF with a process pool and a per-page cache.
+
+    on_pages, if given, is called with the pages done, the page count and the
+    pages per second so far, including pages read from the cache. The cache
+    is kept within PDF_PAGE_CACHE_LIMIT by evicting the pages of the least
+    recently used PDFs.
+    """
+    if PdfReader is None:
+        raise ValueError("PDF import needs PyPDF2. Install it with: pip install PyPDF2")
+
+    start = time.perf_counter()
+    stat = os.stat(filename)
+    key = repr((os.path.abspath(filename), stat.st_size, stat.st_mtime_ns))
+    page_dir = os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    pages = [None] * len(PdfReader(filename).pages)
+    missing = []
+    for number in range(len(pages)):
+        try:
+            with open(os.path.join(page_dir, f"{number}.txt"), 'r', encoding='utf-8', newline='') as file:
+                pages[number] = file.read()
+        except OSError:
+            missing.append(number)
+
+    done = len(pages) - len(missing)
+    if missing:
+        os.makedirs(page_dir, exist_ok=True)
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            tasks = [executor.submit(extract_pdf_page_texts, filename, missing[i:i + PDF_PAGES_PER_TASK])
+                     for i in range(0, len(missing), PDF_PAGES_PER_TASK)]
+            for task in as_completed(tasks):
+                for number, text in task.result():
+                    pages[number] = text
+                    path = os.path.join(page_dir, f"{number}.txt")
+                    try:
+                        with open(f"{path}.tmp", 'w', encoding='utf-8', newline='') as file:
+                            file.write(text)
+                        os.replace(f"{path}.tmp", path)
+                    except OSError:
+                        pass  # The cache is only an optimization
+                    done += 1
+                if on_pages:
+                    on_pages(done, len(pages), done / (time.perf_counter() - start))
+        finally:
+            executor.shutdown(cancel_futures=True)
+        try:
+            prune_pdf_page_cache(cache_dir, keep=page_dir)
+        except OSError:
+            pass  # The cache is only an optimization
+    else:
+        try:
+            os.utime(page_dir)  # Mark the pages as recently used
+        except OSError:
+            pass
+
+    if on_pages:
+        on_pages(done, len(pages), done / max(time.perf_counter() - start, 1e-9))
+    return pages
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+def iter_docx_lines(document):
+    """Yield the lines of each paragraph in a word/document.xml stream, table cells included.
+
+    The XML is read with iterparse and every paragraph and table is cleared,
+    along with the siblings already read before it, so the tree never holds
+    more than the element being read.
+    """
+    if etree is None:
+        raise ValueError("DOCX import needs lxml. Install it with: pip install lxml")
+
+    paragraph, table = f'{WORD_NAMESPACE}p', f'{WORD_NAMESPACE}tbl'
+    text, tab = f'{WORD_NAMESPACE}t', f'{WORD_NAMESPACE}tab'
+    breaks = (f'{WORD_NAMESPACE}br', f'{WORD_NAMESPACE}cr')
+
+    for _, element in etree.iterparse(document, events=('end',), tag=(paragraph, table)):
+        if element.tag == paragraph:
+            parts = []
+            for node in element.iter(text, tab, *breaks):
+                if node.tag == text:
+                    parts.append(node.text or '')
+                elif node.tag == tab:
+                    parts.append('\t')
+                else:
+                    parts.append('\n')
+            lines = ''.join(parts).split('\n')
+            if len(lines) > 1:
+                # A break ending a paragraph, as Shift+Enter leaves, or doubled, isn't a blank line ending the question
+                lines = [line for line in lines if line.strip()] or ['']
+            yield from lines
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+def stitch_pdf_pages(pages, classify):
+    """Join page texts into one list of lines, undoing line breaks forced by page boundaries.
+
+    Bare page numbers at the top or bottom of a page are dropped. The first
+    line of a page is joined onto the last line of the previous page when it
+    doesn't start a question, option, answer or answer key line, and the
+    previous line isn't an answer.
+    """
+    lines = []
+    for text in pages:
+        page_lines = [line.strip() for line in text.splitlines()]
+
+        # Drop page numbers printed in the header or footer
+        filled = [i for i, line in enumerate(page_lines) if line]
+        for i in sorted({filled[0], filled[-1]} if filled else (), reverse=True):
+            if page_lines[i].isdigit():
+                del page_lines[i]
+
+        if lines and lines[-1] and page_lines and page_lines[0]:
+            previous, first = lines[-1], page_lines[0]
+            if (classify(first) is None and not ANSWER_KEY_PATTERN.match(first)
+                    and classify(previous) != ANSWER_LINE and not ANSWER_KEY_PATTERN.match(previous)):
+                lines[-1] = f"{previous} {page_lines.pop(0)}"
+
+        lines.extend(page_lines)
+    return lines
+
+def load_questions(filename, question_prefix, option_prefixes, answer_prefix):
+    """Load questions from a specified file, parsing them based on provided prefixes."""
+    questions = list(parse_questions(filename, question_prefix, option_prefixes, answer_prefix))
 
     if not questions:
         raise ValueError("No questions found in the file. Please check the file format.")
@@ -81,21 +662,2009 @@ def load_questions(filename, question_prefix, option_prefixes, answer_prefix):
     random.shuffle(questions)
     return questions
 
-class QuizApp:
+# Compiled question banks are cached on disk so unchanged files are not re-parsed
+BANK_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".quizapp", "banks")
+BANK_CACHE_LIMIT = 256 * 1024 * 1024  # Bytes kept before the least recently used banks are evicted
+BANK_MAGIC = b'QUIZBANK'
+BANK_VERSION = 4
+# magic, version, records, strings, total options, min options, max options, text bytes, answer bytes
+BANK_HEADER = struct.Struct('<8sIQQQIIQQ4x')
+DECODED_CACHE_SIZE = 64  # Decoded records kept by a mapped bank
+PREFETCH_COUNT = 4  # Upcoming questions decoded while the user reads the current one
+
+def _padding(size):
+    """Return the zero bytes needed to align size to 8 bytes."""
+    return bytes(-size % 8)
+
+def write_bank(path, bank):
+    """Write a QuestionBank to a compiled bank file, replacing it atomically.
+
+    The layout is the header, the text buffer, the answer buffer, then the
+    string_offsets, record_index, answer_offsets, answer_masks and
+    line_numbers arrays, stored as 64-bit integers, with each section
+    aligned to 8 bytes.
+    """
+    stats = bank.stats()
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(BANK_HEADER.pack(
+                BANK_MAGIC, BANK_VERSION, stats['records'], stats['strings'], stats['options'],
+                stats['min_options'], stats['max_options'], stats['text_size'], stats['answer_size']))
+            for data in (bank.text, bank.answers):
+                file.write(data)
+                file.write(_padding(len(data)))
+            for column in (bank.string_offsets, bank.record_index, bank.answer_offsets, bank.answer_masks,
+                           bank.line_numbers):
+                array('Q', column).tofile(file)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def read_bank_header(path):
+    """Read the record count and option statistics of a compiled bank without decoding it."""
+    with open(path, 'rb') as file:
+        data = file.read(BANK_HEADER.size)
+    if len(data) < BANK_HEADER.size:
+        raise ValueError("Not a compiled question bank.")
+
+    magic, version, records, strings, options, min_options, max_options, text_size, answer_size = BANK_HEADER.unpack(data)
+    if magic != BANK_MAGIC or version != BANK_VERSION:
+        raise ValueError("Not a compiled question bank.")
+
+    return {
+        'records': records,
+        'strings': strings,
+        'options': options,
+        'min_options': min_options,
+        'max_options': max_options,
+        'text_size': text_size,
+        'answer_size': answer_size,
+    }
+
+def bank_file_size(header):
+    """Return the size a compiled bank file with this header should have."""
+    records = header['records']
+    return (BANK_HEADER.size + header['text_size'] + len(_padding(header['text_size']))
+            + header['answer_size'] + len(_padding(header['answer_size']))
+            + 8 * (header['strings'] + 1) + 8 * (records + 1) * 2 + 8 * records * 2)
+
+class MappedQuestionBank(QuestionBank):
+    """Read-only QuestionBank over a memory-mapped compiled bank file.
+
+    The columns are views of the mapping, so opening a bank reads only its
+    header and resident memory stays flat whatever the bank size; the OS
+    pages text in as questions are decoded. Recently decoded records are
+    kept in a small LRU, which prefetch fills ahead of the user. problems
+    is found from the stored answers and line numbers the first time it is
+    read, so a bank loaded from the cache reports them like a parsed one.
+    """
+
+    _problems = None
+
+    def __init__(self, path, header=None, cache_size=DECODED_CACHE_SIZE):
+        self.header = header or read_bank_header(path)
+        with open(path, 'rb') as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mapping) != bank_file_size(self.header):
+            self.mapping.close()
+            raise ValueError("Compiled question bank is truncated.")
+        if hasattr(mmap, 'MADV_RANDOM'):
+            self.mapping.madvise(mmap.MADV_RANDOM)  # Questions are read in shuffled order
+
+        view = memoryview(self.mapping)
+        position = BANK_HEADER.size
+        self.text = view[position:position + self.header['text_size']]
+        position += self.header['text_size'] + len(_padding(self.header['text_size']))
+        self.answers = view[position:position + self.header['answer_size']]
+        position += self.header['answer_size'] + len(_padding(self.header['answer_size']))
+
+        records = self.header['records']
+        for name, count in (('string_offsets', self.header['strings'] + 1), ('record_index', records + 1),
+                            ('answer_offsets', records + 1), ('answer_masks', records), ('line_numbers', records)):
+            setattr(self, name, view[position:position + 8 * count].cast('Q'))
+            position += 8 * count
+
+        self.decoded = OrderedDict()
+        self.cache_size = cache_size
+
+    @property
+    def problems(self):
+        if self._problems is None:
+            self._problems = self.validate_answers()
+        return self._problems
+
+    @problems.setter
+    def problems(self, problems):
+        self._problems = problems
+
+    def __getitem__(self, question_id):
+        """Decode one record into a dict, through the LRU of recently decoded records."""
+        record = self.decoded.get(question_id)
+        if record is None:
+            record = super().__getitem__(question_id)
+            self.decoded[question_id] = record
+            if len(self.decoded) > self.cache_size:
+                self.decoded.popitem(last=False)
+        else:
+            self.decoded.move_to_end(question_id)
+        return record
+
+    def prefetch(self, question_ids):
+        """Decode records that are about to be shown into the LRU."""
+        for question_id in question_ids:
+            self[question_id]
+
+    def stats(self):
+        """Return the statistics stored in the header."""
+        return dict(self.header)
+
+def bank_cache_path(filename, question_prefix, option_prefixes, answer_prefix, cache_dir=BANK_CACHE_DIR):
+    """Return the cache file for a question file and prefix configuration."""
+    stat = os.stat(filename)
+    key = repr((os.path.abspath(filename), stat.st_size, stat.st_mtime_ns,
+                question_prefix, list(option_prefixes), answer_prefix, BANK_VERSION))
+    return os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.qbank')
+
+def prune_bank_cache(cache_dir=BANK_CACHE_DIR, limit=BANK_CACHE_LIMIT):
+    """Evict the least recently used banks until the cache fits in limit bytes."""
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.qbank'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+def load_questions_cached(filename, question_prefix, option_prefixes, answer_prefix,
+                          cache_dir=BANK_CACHE_DIR, on_header=None, on_progress=None, on_pages=None):
+    """Load a QuestionBank through the compiled bank cache, parsing the file only on a miss.
+
+    The bank is returned mapped from the cache file, so records are decoded
+    only when read. on_header, if given, is called with the header statistics
+    of a cached bank before it is mapped. on_progress and on_pages are passed
+    on to parse_questions.
+    """
+    path = bank_cache_path(filename, question_prefix, option_prefixes, answer_prefix, cache_dir)
+    try:
+        header = read_bank_header(path)
+        if on_header:
+            on_header(header)
+        bank = MappedQuestionBank(path, header)
+        os.utime(path)  # Mark the bank as recently used
+    except (OSError, ValueError):
+        bank = parse_questions(filename, question_prefix, option_prefixes, answer_prefix, on_progress, on_pages)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            write_bank(path, bank)
+            prune_bank_cache(cache_dir)
+            mapped = MappedQuestionBank(path)  # Let the parsed copy go
+            mapped.problems = bank.problems  # Found while parsing; no need to validate again
+            bank = mapped
+        except (OSError, ValueError):
+            pass  # The cache is only an optimization
+
+    if not len(bank):
+        raise ValueError("No questions found in the file. Please check the file format.")
+
+    return bank
+
+class ShuffledOrder:
+    """Random permutation of question ids, generated lazily from a seed.
+
+    Positions are produced on demand by an incremental Fisher-Yates shuffle
+    that remembers only the entries it has displaced, so asking 50 questions
+    of a 200k bank costs 50 steps, and the same seed always gives the same
+    order. first, if given, is forced to the front. ids, if given, are the
+    question ids being permuted; otherwise they are range(count).
+    """
+
+    def __init__(self, count, seed, first=None, ids=None):
+        self.count = count
+        self.seed = seed
+        self.first = first
+        self.ids = ids
+        self.random = random.Random(f"order:{seed}")
+        self.displaced = {}  # Position -> value, for positions the shuffle has swapped into
+        self.generated = array('Q')
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self.count))]
+        if not 0 <= position < self.count:
+            raise IndexError("order position out of range")
+
+        while len(self.generated) <= position:
+            i = len(self.generated)
+            j = self.first if i == 0 and self.first is not None else self.random.randrange(i, self.count)
+            value = self.displaced.get(j, j)
+            displaced = self.displaced.pop(i, i)  # Position i is never looked at again
+            if j != i:
+                self.displaced[j] = displaced
+            self.generated.append(value)
+
+        value = self.generated[position]
+        return self.ids[value] if self.ids is not None else value
+
+class KeyedOrder:
+    """Random permutation of range(count) keyed by a seed, with no state to keep.
+
+    Each position is mapped on its own through a four-round Feistel network
+    over the smallest power of four that holds count, walking the cycle
+    until the value falls inside range(count), in fewer than four tries on
+    average. Unlike ShuffledOrder nothing is remembered between lookups, so
+    a seed and a position are all it takes to carry an order around.
+    """
+
+    def __init__(self, count, seed):
+        self.count = count
+        self.half = max(((count - 1).bit_length() + 1) // 2, 1)
+        self.mask = (1 << self.half) - 1
+        self.keys = [(((seed + i * 0x9E3779B97F4A7C15) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF) >> 32 for i in range(4)]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.count:
+            raise IndexError("order position out of range")
+        half, mask, shift = self.half, self.mask, 32 - self.half
+        value = position
+        while True:
+            left, right = value >> half, value & mask
+            for key in self.keys:
+                left, right = right, left ^ (((right ^ key) * 0x9E3779B1) & 0xFFFFFFFF) >> shift
+            value = left << half | right
+            if value < self.count:
+                return value
+
+class ReservoirSampler:
+    """Choose count positions uniformly from a stream of unknown length (Algorithm L).
+
+    offer(position) is called for each item in turn and returns the slot to
+    store it in, or None to drop it. The picks depend only on the seed and the
+    stream length, so sampling records while parsing and sampling ids of a
+    compiled bank with sample() choose the same questions.
+    """
+
+    def __init__(self, count, seed):
+        self.count = count
+        self.random = random.Random(f"sample:{seed}")
+        self.weight = 1.0
+        self.next = count - 1
+        self.advance()
+
+    def uniform(self):
+        """Return a random float in the open interval (0, 1)."""
+        value = 0.0
+        while value == 0.0:
+            value = self.random.random()
+        return value
+
+    def advance(self):
+        """Skip ahead to the next position that replaces a slot."""
+        self.weight *= math.exp(math.log(self.uniform()) / self.count)
+        self.next += math.floor(math.log(self.uniform()) / math.log(1 - self.weight)) + 1
+
+    def offer(self, position):
+        """Return the slot for the item at position, or None if it isn't kept."""
+        if position < self.count:
+            return position
+        if position < self.next:
+            return None
+        slot = self.random.randrange(self.count)
+        self.advance()
+        return slot
+
+    def sample(self, length):
+        """Return the positions picked from a stream of length items, in slot order."""
+        slots = list(range(min(self.count, length)))
+        while self.next < length:
+            slots[self.random.randrange(self.count)] = self.next
+            self.advance()
+        return slots
+
+def sample_questions(filename, question_prefix, option_prefixes, answer_prefix, count, seed,
+                     on_progress=None, on_pages=None):
+    """Parse a question file keeping only a uniform sample of count records.
+
+    Returns a QuestionBank of the sample in reservoir slot order. Only count
+    records are held at any time; answers from a trailing answer key are
+    resolved by each record's number in the file. on_progress, if given, is
+    called with the bytes read and the records seen every PROGRESS_INTERVAL
+    records.
+    """
+    sampler = ReservoirSampler(count, seed)
+    reservoir = []
+    answer_map = {}
+
+    with open_question_lines(filename, question_prefix, option_prefixes, answer_prefix, on_pages) as (lines, position):
+        records = iter_questions(lines, question_prefix, option_prefixes, answer_prefix, answer_map)
+        for number, question in enumerate(records, 1):
+            slot = sampler.offer(number - 1)
+            if slot == len(reservoir):
+                reservoir.append((number, question))
+            elif slot is not None:
+                reservoir[slot] = (number, question)
+            if on_progress and number % PROGRESS_INTERVAL == 0:
+                on_progress(position(), number)
+
+    for number, question in reservoir:
+        if not question['answer']:
+            question['answer'] = answer_map.get(number, '')
+    bank = QuestionBank.from_questions(question for _, question in reservoir)
+    bank.problems = bank.validate_answers()
+    bank.source_ids = array('Q', (number - 1 for number, _ in reservoir))
+    return bank
+
+def load_quiz_sample(filename, question_prefix, option_prefixes, answer_prefix, count, seed,
+                     cache_dir=BANK_CACHE_DIR, on_progress=None, on_pages=None):
+    """Load a quiz of count questions drawn uniformly from a bank, and the order to ask them in.
+
+    A compiled bank in the cache is sampled by id without decoding anything
+    else; otherwise the file is parsed keeping only the sample. Both choose
+    the same questions for the same seed.
+    """
+    try:
+        bank = MappedQuestionBank(bank_cache_path(filename, question_prefix, option_prefixes, answer_prefix, cache_dir))
+        ids = ReservoirSampler(count, seed).sample(len(bank))
+        order = ShuffledOrder(len(ids), seed, ids=ids)
+    except (OSError, ValueError):
+        bank = sample_questions(filename, question_prefix, option_prefixes, answer_prefix, count, seed,
+                                on_progress, on_pages)
+        order = ShuffledOrder(len(bank), seed)
+
+    if not len(order):
+        raise ValueError("No questions found in the file. Please check the file format.")
+
+    return bank, order
+
+class LoadCancelled(Exception):
+    """Raised inside a loading worker when the user cancels the load."""
+
+def load_questions_in_background(events, cancel, filename, question_prefix, option_prefixes, answer_prefix,
+                                 seed, count=None, first=None, mode='shuffled'):
+    """Load a bank on a worker thread, reporting to the UI through the events queue.
+
+    Events are tuples: ('header', header), ('progress', bytes_read, found),
+    ('pages', done, total, pages_per_second), ('preview', bank),
+    ('done', bank, order), ('error', message) and ('cancelled',). order is a
+    ShuffledOrder of the question ids to ask, derived from seed. With count,
+    only a sample of that many questions is loaded. Otherwise a preview is
+    sent: a one-question bank sampled from the first answered questions
+    parsed, so the quiz can start before the whole file is read. Its id is
+    put at the front of the final order. Given first, as when resuming a
+    session, no preview is sent and the order starts with that id instead.
+    In the 'review' and 'adaptive' modes, the whole bank is loaded without a
+    preview and order is a ReviewOrder of at most count cards, or an
+    AdaptiveOrder of count questions (ADAPTIVE_DRILL_SIZE without one), over
+    the file's CardStore.
+    """
+    preview = first
+    scanned = 0
+
+    def on_progress(bytes_read, bank):
+        nonlocal preview, scanned
+        if cancel.is_set():
+            raise LoadCancelled()
+        events.put(('progress', bytes_read, len(bank)))
+
+        # Questions answered through a trailing answer key can't be graded yet
+        if preview is None and mode == 'shuffled':
+            answered = [question_id for question_id in range(scanned, len(bank)) if bank.answer(question_id)]
+            scanned = len(bank)
+            if answered:
+                preview = random.choice(answered)
+                events.put(('preview', QuestionBank.from_questions([bank[preview]])))
+
+    def on_sample_progress(bytes_read, seen):
+        if cancel.is_set():
+            raise LoadCancelled()
+        events.put(('progress', bytes_read, seen))
+
+    def on_pages(done, total, rate):
+        if cancel.is_set():
+            raise LoadCancelled()
+        events.put(('pages', done, total, rate))
+
+    try:
+        if count and mode == 'shuffled':
+            bank, order = load_quiz_sample(filename, question_prefix, option_prefixes, answer_prefix, count, seed,
+                                           on_progress=on_sample_progress, on_pages=on_pages)
+        else:
+            bank = load_questions_cached(filename, question_prefix, option_prefixes, answer_prefix,
+                                         on_header=lambda header: events.put(('header', header)),
+                                         on_progress=on_progress, on_pages=on_pages)
+            if mode == 'shuffled':
+                order = ShuffledOrder(len(bank), seed, first=preview)
+            else:
+                store = CardStore.open(card_store_path(filename, question_prefix, option_prefixes, answer_prefix), len(bank))
+                ungradable = {question_id for _, question_id, _ in bank.problems}
+                if mode == 'review':
+                    order = ReviewOrder(ReviewScheduler(store, skip=ungradable), now_minutes(), seed, count)
+                else:
+                    order = AdaptiveOrder(EloRatingModel(store, seed, ungradable), count or ADAPTIVE_DRILL_SIZE)
+        bank.problems  # A mapped bank validates its answers on first use: here, not on the UI thread
+        if cancel.is_set():
+            raise LoadCancelled()
+    except LoadCancelled:
+        events.put(('cancelled',))
+        return
+    except Exception as e:  # Anything left uncaught here would leave the UI waiting forever
+        events.put(('error', str(e)))
+        return
+
+    events.put(('done', bank, order))
+
+class QuizSession:
+    """Scoring and progression for one quiz, with no UI attached.
+
+    Questions are asked in order, a sequence of question ids into bank.
+    answer() grades a selection, given as an answer mask (bit i for option
+    chr(65 + i)), against the current question with one integer compare;
+    advance() moves on. points totals the credit given by policy, one of
+    SCORING_POLICIES, which may give partial credit. Changes are reported to
+    the listeners added with subscribe(), called as listener(event, *args):
+
+        ('question', position, question_id)  a question is up to be answered
+        ('answered', position, question_id, mask, correct)
+        ('finished',)  no question left in the order
+    """
+
+    def __init__(self, bank, order, policy=all_or_nothing):
+        self.bank = bank
+        self.order = order
+        self.policy = policy
+        self.position = 0  # Index into order of the question being asked
+        self.score = 0
+        self.points = 0.0
+        self.attempted = 0
+        self.incorrect = 0
+        self.selections = array('Q')  # Selected answer mask for each question answered, in order
+        self.incorrect_answers = array('Q')  # Ids of the questions answered wrongly
+        self.incorrect_selections = array('Q')  # What was selected for each of those
+        self.listeners = []
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def emit(self, event, *args):
+        for listener in self.listeners:
+            listener(event, *args)
+
+    def current(self):
+        """Id of the question being asked, or None once the order is used up."""
+        return self.order[self.position] if self.position < len(self.order) else None
+
+    def start(self):
+        """Announce the first question."""
+        self.announce()
+
+    def announce(self):
+        if self.position < len(self.order):
+            self.emit('question', self.position, self.order[self.position])
+        else:
+            self.emit('finished')
+
+    def answer(self, mask):
+        """Grade a selection for the current question and return whether it was right."""
+        question_id = self.order[self.position]
+        expected = self.bank.answer_masks[question_id]
+        correct = mask == expected
+        self.attempted += 1
+        self.selections.append(mask)
+        if correct:
+            self.score += 1
+        else:
+            self.incorrect += 1
+            self.incorrect_answers.append(question_id)
+            self.incorrect_selections.append(mask)
+        # The default policy needs no call: a right answer is one point
+        self.points += correct if self.policy is all_or_nothing else self.policy(mask, expected)
+        if self.listeners:
+            self.emit('answered', self.position, question_id, mask, correct)
+        return correct
+
+    def advance(self):
+        """Move on to the next question."""
+        self.position += 1
+        if self.listeners:
+            self.announce()
+
+    def submit(self, mask):
+        """Answer the current question and move on."""
+        correct = self.answer(mask)
+        self.advance()
+        return correct
+
+    def replay(self, answers):
+        """Re-apply (question_id, mask) answers recorded from this quiz, before any listener is added.
+
+        Question ids are those in the whole file, as a SessionJournal records
+        them. Raises ValueError if they were not given to the questions of
+        this order, e.g. because the question file has changed.
+        """
+        source_ids = self.bank.source_ids
+        for question_id, mask in answers:
+            asked = self.order[self.position] if self.position < len(self.order) else None
+            if asked is not None and source_ids is not None:
+                asked = source_ids[asked]
+            if asked != question_id:
+                raise ValueError("The saved session does not match the question file; it may have changed.")
+            self.answer(mask)
+            self.position += 1
+
+    def replace_bank(self, bank, order):
+        """Carry on with the full bank once it has loaded behind a preview question.
+
+        The preview's id is order[0] in the full bank. A session that had run
+        out of questions announces the next one.
+        """
+        waiting = self.position >= len(self.order)
+        self.bank, self.order = bank, order
+        if self.incorrect_answers:
+            self.incorrect_answers[0] = order[0]
+        if waiting:
+            self.announce()
+
+    def remaining(self):
+        """Questions left after the current one."""
+        return max(len(self.order) - (self.position + 1), 0)
+
+    def percentage_incorrect(self):
+        """Calculate the percentage of incorrect answers."""
+        return (self.incorrect / self.attempted * 100) if self.attempted > 0 else 0
+
+    def percentage(self):
+        """Score as a percentage of the questions in the quiz."""
+        return (self.score / len(self.order) * 100) if len(self.order) > 0 else 0
+
+    def progress(self):
+        """Fraction of the quiz attempted."""
+        return self.attempted / len(self.order) if len(self.order) > 0 else 0
+
+# Answers are journaled as they are given, so a closed session can be resumed
+SESSION_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".quizapp", "session.journal")
+JOURNAL_MAGIC = b'QUIZJRNL'
+JOURNAL_VERSION = 2
+# magic, version, settings size, shuffle seed, quiz size asked for (0 for all), first question id, quiz length
+JOURNAL_HEADER = struct.Struct('<8sIIQQQQ')
+JOURNAL_RECORD = struct.Struct('<QQII')  # question id in the whole file, selected mask, 1 if correct, elapsed ms
+JOURNAL_NO_FIRST = 2 ** 64 - 1
+JOURNAL_FLUSH_MS = 1000  # How often buffered answers are written and synced
+
+class SessionJournal:
+    """Append-only log of the answers given in a quiz session.
+
+    The file starts with a header holding what rebuilds the quiz: the
+    source file and prefixes (as JSON), the shuffle seed, the quiz size and
+    the first question. One fixed-size JOURNAL_RECORD per answer follows.
+    Records are buffered and written with an fsync by flush(), which the UI
+    calls on a timer, so a crash loses at most the answers since the last
+    flush. Subscribe on_session_event to a QuizSession to record its answers.
+    Questions of a sampled bank are recorded by their source_ids, as a quiz
+    sampled from the cached bank on resume numbers them differently.
+    """
+
+    def __init__(self, path, file, source_ids=None):
+        self.path = path
+        self.file = file
+        self.source_ids = source_ids  # Sampled bank id -> id in the whole file
+        self.pending = bytearray()
+        self.shown_at = time.monotonic()
+
+    @classmethod
+    def create(cls, path, settings, seed, count, first, length, source_ids=None):
+        """Start a new journal at path, replacing any previous one."""
+        settings = json.dumps(settings).encode('utf-8')
+        header = JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, len(settings), seed, count or 0,
+                                     JOURNAL_NO_FIRST if first is None else first, length)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(header + settings + _padding(len(settings)))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        return cls(path, open(path, 'ab'), source_ids)
+
+    @classmethod
+    def reopen(cls, path, source_ids=None):
+        """Carry on appending to an existing journal, dropping a record torn by a crash."""
+        header = read_journal_header(path)
+        file = open(path, 'r+b')
+        file.truncate(header['data_start'] + header['answered'] * JOURNAL_RECORD.size)
+        file.seek(0, os.SEEK_END)
+        return cls(path, file, source_ids)
+
+    def on_session_event(self, event, *args):
+        if event == 'question':
+            self.shown_at = time.monotonic()
+        elif event == 'answered':
+            position, question_id, mask, correct = args
+            self.record(question_id, mask, correct, int((time.monotonic() - self.shown_at) * 1000))
+
+    def record(self, question_id, mask, correct, elapsed_ms=0):
+        if self.source_ids is not None:
+            question_id = self.source_ids[question_id]
+        self.pending += JOURNAL_RECORD.pack(question_id, mask, int(correct), min(elapsed_ms, 0xFFFFFFFF))
+
+    def flush(self):
+        """Write the buffered records and sync them to disk."""
+        if self.pending:
+            self.file.write(self.pending)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending.clear()
+
+    def close(self, remove=False):
+        """Flush and close the journal, deleting it if the session is over."""
+        try:
+            self.flush()
+        finally:
+            self.file.close()
+        if remove:
+            os.remove(self.path)
+
+def read_journal_header(path):
+    """Read a journal's header as a dict, without reading its answers.
+
+    The dict holds the settings, the seed, count and first (None when there
+    was none), the quiz length, where the records start and how many whole
+    records there are; a record torn by a crash is not counted.
+    """
+    with open(path, 'rb') as file:
+        data = file.read(JOURNAL_HEADER.size)
+        if len(data) < JOURNAL_HEADER.size:
+            raise ValueError("Session journal is truncated.")
+        magic, version, settings_size, seed, count, first, length = JOURNAL_HEADER.unpack(data)
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+            raise ValueError("Not a session journal, or from another version of the app.")
+        settings = json.loads(file.read(settings_size).decode('utf-8'))
+        size = os.fstat(file.fileno()).st_size
+
+    data_start = JOURNAL_HEADER.size + settings_size + len(_padding(settings_size))
+    return {
+        'settings': settings,
+        'seed': seed,
+        'count': count or None,
+        'first': None if first == JOURNAL_NO_FIRST else first,
+        'length': length,
+        'data_start': data_start,
+        'answered': max(size - data_start, 0) // JOURNAL_RECORD.size,
+    }
+
+def read_journal(path):
+    """Read a journal's header and its answers, as a flat array of question id, mask pairs."""
+    header = read_journal_header(path)
+    with open(path, 'rb') as file:
+        file.seek(header['data_start'])
+        data = file.read(header['answered'] * JOURNAL_RECORD.size)
+
+    answers = array('Q')
+    for question_id, mask, _, _ in JOURNAL_RECORD.iter_unpack(data[:len(data) - len(data) % JOURNAL_RECORD.size]):
+        answers.append(question_id)
+        answers.append(mask)
+    return header, answers
+
+# Spaced repetition and adaptive drills: per-question state, kept across sessions in one store per question file
+CARD_STORE_DIR = os.path.join(os.path.expanduser("~"), ".quizapp", "cards")
+CARD_MAGIC = b'QUIZCARD'
+CARD_VERSION = 3
+CARD_HEADER = struct.Struct('<8sI4xQdQ')  # magic, version, card count, learner ability, answers rated
+# Columns, one entry per question id: due and interval in minutes, ease in thousandths, right answers in a row,
+# and the item's difficulty on the ability scale
+CARD_COLUMNS = (('due', 'I'), ('interval', 'I'), ('ease', 'H'), ('repetitions', 'B'), ('difficulty', 'f'))
+CARD_ID_BITS = 32  # Due queue entries pack the due time above the question id
+MINUTES_PER_DAY = 24 * 60
+NEW_CARDS_PER_SESSION = 20  # Questions never reviewed before, introduced per review session
+RELEARN_LIMIT = 2  # Times a card answered wrongly is asked again in the same session
+SM2_START_EASE = 2500
+SM2_MIN_EASE = 1300
+SM2_CORRECT_QUALITY = 4  # SM-2 grades recall 0-5; a right answer keeps the ease, a wrong one lowers it
+SM2_WRONG_QUALITY = 1
+LEITNER_INTERVAL_DAYS = (1, 2, 4, 8, 16, 32)  # Review interval of each Leitner box
+ADAPTIVE_DRILL_SIZE = 20  # Questions in an adaptive drill when no quiz size is given
+ELO_ABILITY_K = 1.0  # The ability moves by K / (1 + decay * answers rated) times the surprise of each answer
+ELO_ABILITY_DECAY = 0.05
+ELO_DIFFICULTY_K = 0.2
+
+def now_minutes():
+    """Minutes since the epoch, the clock card due times are kept in."""
+    return int(time.time() // 60)
+
+def sm2_schedule(interval, ease, repetitions, correct):
+    """SM-2: after 1 and 6 days, each interval is the last one times the ease.
+
+    Takes and returns a card's interval in minutes, ease in thousandths (0
+    for a new card) and right answers in a row. A wrong answer starts the
+    card over at one day and lowers its ease, down to SM2_MIN_EASE.
+    """
+    ease = ease or SM2_START_EASE
+    quality = SM2_CORRECT_QUALITY if correct else SM2_WRONG_QUALITY
+    if not correct:
+        interval, repetitions = MINUTES_PER_DAY, 0
+    elif repetitions == 0:
+        interval = MINUTES_PER_DAY
+    elif repetitions == 1:
+        interval = 6 * MINUTES_PER_DAY
+    else:
+        interval = interval * ease // 1000
+    ease = max(ease + 100 - (5 - quality) * (80 + (5 - quality) * 20), SM2_MIN_EASE)
+    return min(interval, 0xFFFFFFFF), min(ease, 0xFFFF), min(repetitions + correct, 0xFF)
+
+def leitner_schedule(interval, ease, repetitions, correct):
+    """Leitner boxes: a right answer moves the card up a box, a wrong one back to the first.
+
+    The box is the number of right answers in a row, capped at the last
+    box, and sets the interval from LEITNER_INTERVAL_DAYS.
+    """
+    box = min(repetitions + 1, len(LEITNER_INTERVAL_DAYS)) if correct else 0
+    return LEITNER_INTERVAL_DAYS[max(box - 1, 0)] * MINUTES_PER_DAY, ease, box
+
+SCHEDULES = {
+    'sm2': sm2_schedule,
+    'leitner': leitner_schedule,
+}
+
+def card_store_layout(count):
+    """Return (name, typecode, offset, size) for each column of a store of count cards, and the file size."""
+    layout = []
+    position = CARD_HEADER.size
+    for name, typecode in CARD_COLUMNS:
+        size = array(typecode).itemsize * count
+        layout.append((name, typecode, position, size))
+        position += size + len(_padding(size))
+    return layout, position
+
+def source_key(filename, question_prefix, option_prefixes, answer_prefix):
+    """Return the name the stores kept for a question file and prefix configuration share.
+
+    Unlike the bank cache key it leaves out the file's size and mtime, so
+    review state and results survive edits to the file.
+    """
+    key = repr((os.path.abspath(filename), question_prefix, list(option_prefixes), answer_prefix))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def card_store_path(filename, question_prefix, option_prefixes, answer_prefix, cache_dir=CARD_STORE_DIR):
+    """Return the card store for a question file and prefix configuration."""
+    return os.path.join(cache_dir, source_key(filename, question_prefix, option_prefixes, answer_prefix) + '.cards')
+
+class CardStore:
+    """Review state of every question of a bank, memory-mapped from a file.
+
+    The file holds a CARD_HEADER and the CARD_COLUMNS as fixed-width arrays
+    indexed by question id, 15 bytes a card. A due time of 0 marks a card
+    that has never been reviewed. The columns are views of the mapping, so
+    opening a store reads only its header; building the due queue reads the
+    due column alone, and the rest is paged in as cards are reviewed.
+    Updates are written through the mapping; flush() syncs them to disk.
+    The header also holds the learner's ability, which save_learner()
+    writes back.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'r+b') as file:
+            header = read_card_store_header(file)
+            self.mapping = mmap.mmap(file.fileno(), 0)
+        self.count = header['count']
+        self.ability = header['ability']
+        self.responses = header['responses']
+        layout, size = card_store_layout(self.count)
+        if len(self.mapping) != size:
+            self.mapping.close()
+            raise ValueError("Card store is truncated.")
+
+        self.view = memoryview(self.mapping)
+        for name, typecode, offset, size in layout:
+            setattr(self, name, self.view[offset:offset + size].cast(typecode))
+
+    @classmethod
+    def open(cls, path, count):
+        """Map the store at path for a bank of count questions, creating or growing it as needed.
+
+        Questions added at the end of a file keep the state of the ones
+        before them. A store with more cards than the bank has questions
+        belongs to an older version of the file whose ids no longer line
+        up, so it is started over.
+        """
+        try:
+            with open(path, 'rb') as file:
+                stored = read_card_store_header(file)['count']
+        except (OSError, ValueError):
+            stored = None
+        if stored != count:
+            write_card_store(path, count, path if stored is not None and stored < count else None)
+        return cls(path)
+
+    def __len__(self):
+        return self.count
+
+    def update(self, question_id, due, interval, ease, repetitions):
+        self.due[question_id] = due
+        self.interval[question_id] = interval
+        self.ease[question_id] = ease
+        self.repetitions[question_id] = repetitions
+
+    def save_learner(self):
+        """Write the ability and answer count back to the header."""
+        CARD_HEADER.pack_into(self.mapping, 0, CARD_MAGIC, CARD_VERSION, self.count, self.ability, self.responses)
+
+    def flush(self):
+        """Sync the cards reviewed so far to disk."""
+        self.mapping.flush()
+
+    def close(self):
+        """Flush the store and unmap it."""
+        self.flush()
+        for name, _ in CARD_COLUMNS:
+            getattr(self, name).release()
+        self.view.release()
+        self.mapping.close()
+
+def read_card_store_header(file):
+    """Read the card count and learner ability of an open card store."""
+    data = file.read(CARD_HEADER.size)
+    if len(data) < CARD_HEADER.size:
+        raise ValueError("Not a card store.")
+    magic, version, count, ability, responses = CARD_HEADER.unpack(data)
+    if magic != CARD_MAGIC or version != CARD_VERSION:
+        raise ValueError("Not a card store, or from another version of the app.")
+    return {'count': count, 'ability': ability, 'responses': responses}
+
+def write_card_store(path, count, source=None):
+    """Write a store of count new cards to path atomically, keeping the cards of the store at source.
+
+    Windows won't replace a file that is mapped, so the store at source is
+    closed before the new one takes its place; no other store of path may
+    be open.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    old = CardStore(source) if source else None
+    layout, size = card_store_layout(count)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(CARD_HEADER.pack(CARD_MAGIC, CARD_VERSION, count,
+                                        old.ability if old else 0.0, old.responses if old else 0))
+            if old:
+                for name, _, offset, _ in layout:
+                    file.seek(offset)
+                    file.write(getattr(old, name))
+            file.truncate(size)  # New cards are all zeros, left sparse
+        if old:
+            old.close()
+            old = None
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        if old:
+            old.close()
+
+class ReviewScheduler:
+    """Due queue over a CardStore, applying a schedule from SCHEDULES to each review.
+
+    Cards that have been reviewed sit in a binary min-heap of due time and
+    question id packed into one int, so the next due card is found and a
+    reviewed card requeued in O(log n). Requeueing leaves the card's old
+    entry behind; pop_due() skips entries that no longer match the store.
+    Cards never reviewed are kept in new_ids, in id order. The ids in skip,
+    questions whose answer can't be graded, are left out of both: they
+    could never be answered right.
+    """
+
+    def __init__(self, store, schedule=sm2_schedule, skip=()):
+        self.store = store
+        self.schedule = schedule
+        self.heap = []
+        self.new_ids = array('Q')
+        for question_id, due in enumerate(store.due):
+            if question_id in skip:
+                continue
+            if due:
+                self.heap.append(due << CARD_ID_BITS | question_id)
+            else:
+                self.new_ids.append(question_id)
+        heapq.heapify(self.heap)
+
+    def count_due(self, now):
+        """Cards due by now; a scan of the heap, done once per session."""
+        return sum(1 for key in self.heap if key >> CARD_ID_BITS <= now)
+
+    def next_due(self):
+        """Due time of the earliest card in the queue, or None if no card has been reviewed."""
+        while self.heap:
+            key = self.heap[0]
+            question_id = key & ((1 << CARD_ID_BITS) - 1)
+            if self.store.due[question_id] == key >> CARD_ID_BITS:
+                return key >> CARD_ID_BITS
+            heapq.heappop(self.heap)  # Left behind by a later review
+        return None
+
+    def pop_due(self, now):
+        """Take the id of the earliest card due by now off the queue, or None if none is."""
+        due = self.next_due()
+        if due is None or due > now:
+            return None
+        return heapq.heappop(self.heap) & ((1 << CARD_ID_BITS) - 1)
+
+    def review(self, question_id, correct, now):
+        """Schedule a card's next review after an answer, returning when it is due."""
+        store = self.store
+        interval, ease, repetitions = self.schedule(store.interval[question_id], store.ease[question_id],
+                                                    store.repetitions[question_id], correct)
+        due = min(now + interval, 0xFFFFFFFF)
+        store.update(question_id, due, interval, ease, repetitions)
+        heapq.heappush(self.heap, due << CARD_ID_BITS | question_id)
+        return due
+
+class ReviewOrder:
+    """Order of a spaced-repetition session, drawn from a ReviewScheduler as it is asked.
+
+    It stands in for a ShuffledOrder in a QuizSession: first the cards due
+    by now, earliest first, then up to new_limit new cards in an order
+    shuffled from seed, at most limit in all. Subscribe on_session_event to
+    the session so each answer reschedules its card; a card answered wrongly
+    is asked again at the end of the session, up to RELEARN_LIMIT times, so
+    the length grows as the session goes.
+    """
+
+    def __init__(self, scheduler, now, seed, limit=None, new_limit=NEW_CARDS_PER_SESSION):
+        self.scheduler = scheduler
+        self.store = scheduler.store
+        self.now = now
+        self.reviews = scheduler.count_due(now)
+        if limit:
+            self.reviews = min(self.reviews, limit)
+            new_limit = min(new_limit, limit - self.reviews)
+        self.new_cards = ShuffledOrder(len(scheduler.new_ids), seed, ids=scheduler.new_ids)
+        self.new_count = min(new_limit, len(self.new_cards))
+        self.new_taken = 0
+        self.relearn = deque()  # Cards answered wrongly, asked again after the rest
+        self.relearned = Counter()  # Card -> times put back into relearn
+        self.pending = self.reviews + self.new_count  # Cards still to be drawn
+        self.generated = array('Q')
+
+    def __len__(self):
+        return len(self.generated) + self.pending
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if not 0 <= position < len(self):
+            raise IndexError("order position out of range")
+        while len(self.generated) <= position:
+            self.generated.append(self.draw())
+        return self.generated[position]
+
+    def draw(self):
+        """Take the next card: a due one, a new one, or one to relearn."""
+        self.pending -= 1
+        while self.reviews:
+            self.reviews -= 1
+            question_id = self.scheduler.pop_due(self.now)
+            if question_id is not None:
+                return question_id
+        if self.new_taken < self.new_count:
+            self.new_taken += 1
+            return self.new_cards[self.new_taken - 1]
+        return self.relearn.popleft()
+
+    def on_session_event(self, event, *args):
+        if event == 'answered':
+            position, question_id, mask, correct = args
+            self.scheduler.review(question_id, correct, now_minutes())
+            if not correct and self.relearned[question_id] < RELEARN_LIMIT:
+                self.relearned[question_id] += 1
+                self.relearn.append(question_id)
+                self.pending += 1
+
+class EloRatingModel:
+    """Rasch (one-parameter logistic) model of the learner, rated online Elo-style over a CardStore.
+
+    A question of difficulty b is answered right with
+    P = 1 / (1 + exp(b - ability)). update() moves the ability and the
+    question's difficulty by the surprise of each answer; the ability's step
+    shrinks as answers accumulate. select() finds the question of maximum
+    Fisher information P (1 - P) at the current ability, which is the one
+    whose difficulty is closest to it, in one vectorized pass over the
+    difficulty column with NumPy, or in a loop without it. Ties, as between
+    questions never answered, are broken at random. The ids in skip,
+    questions whose answer can't be graded, are never picked: every answer
+    to them would count as wrong and skew both ratings.
+    """
+
+    def __init__(self, store, seed, skip=()):
+        self.store = store
+        self.random = random.Random(f"adaptive:{seed}")
+        self.skip = frozenset(question_id for question_id in skip if question_id < store.count)
+        self.available = store.count - len(self.skip)  # Questions select() can pick
+        if numpy is not None:
+            self.skip_ids = numpy.fromiter(self.skip, numpy.int64, len(self.skip))
+            self.scratch = numpy.empty(store.count, numpy.float32)
+
+    def probability(self, question_id):
+        """Chance the learner answers the question right."""
+        store = self.store
+        return 1 / (1 + math.exp(min(store.difficulty[question_id] - store.ability, 700.0)))
+
+    def update(self, question_id, correct):
+        """Rate an answer: a right one raises the ability and lowers the question's difficulty."""
+        store = self.store
+        surprise = correct - self.probability(question_id)
+        store.ability += ELO_ABILITY_K / (1 + ELO_ABILITY_DECAY * store.responses) * surprise
+        store.responses += 1
+        store.difficulty[question_id] -= ELO_DIFFICULTY_K * surprise
+        store.save_learner()
+
+    def select(self, exclude=()):
+        """Id of the most informative question not in exclude, or None if there is none."""
+        store = self.store
+        if not store.count:
+            return None
+        if numpy is not None:
+            # Computed in place in one scratch array, as temporaries would cost more than the math
+            distance = numpy.subtract(numpy.frombuffer(store.difficulty, numpy.float32), numpy.float32(store.ability),
+                                      out=self.scratch)
+            numpy.abs(distance, out=distance)
+            distance[self.skip_ids] = numpy.inf
+            if len(exclude):
+                distance[numpy.array(exclude, numpy.int64)] = numpy.inf
+            best = distance[distance.argmin()]
+            if best == numpy.inf:
+                return None
+            candidates = numpy.flatnonzero(distance == best)
+            return int(candidates[self.random.randrange(len(candidates))])
+
+        skip = self.skip.union(exclude)
+        best_id, best, ties = None, math.inf, 0
+        for question_id, difficulty in enumerate(store.difficulty):
+            distance = abs(difficulty - store.ability)
+            if distance > best or question_id in skip:
+                continue
+            if distance < best:
+                best_id, best, ties = question_id, distance, 1
+            else:
+                ties += 1  # Keep each of the tied questions with equal chance
+                if self.random.randrange(ties) == 0:
+                    best_id = question_id
+        return best_id
+
+class AdaptiveOrder:
+    """Order of an adaptive drill: each question is the most informative at the learner's ability.
+
+    It stands in for a ShuffledOrder in a QuizSession, asking limit
+    questions of those the model can pick. Subscribe on_session_event to the session so each
+    answer updates the model. Questions looked up ahead of the current one,
+    as the UI does to prefetch them, are picked again after each answer.
+    """
+
+    def __init__(self, model, limit):
+        self.model = model
+        self.store = model.store
+        self.length = min(limit, model.available)
+        self.generated = array('Q')
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self.length))]
+        if not 0 <= position < self.length:
+            raise IndexError("order position out of range")
+        while len(self.generated) <= position:
+            self.generated.append(self.model.select(self.generated))
+        return self.generated[position]
+
+    def on_session_event(self, event, *args):
+        if event == 'answered':
+            position, question_id, mask, correct = args
+            self.model.update(question_id, correct)
+            del self.generated[position + 1:]  # Picked at the ability before this answer
+
+# Results of finished sessions, one log per question file, for item analysis
+RESULTS_DIR = os.path.join(os.path.expanduser("~"), ".quizapp", "results")
+RESULTS_MAGIC = b'QUIZRSLT'
+RESULTS_VERSION = 3
+RESULTS_HEADER = struct.Struct('<8sI4xQ')  # magic, version, log id: random, new for every log created
+RESULT_RECORD = struct.Struct('<IIQB7x')  # student (a finished session), question id, selected mask, session mode
+RESULT_MODES = ('shuffled', 'review', 'adaptive')  # Session modes, by their number in a record
+FIXED_FORM_MODES = ('shuffled',)  # Sessions whose questions don't depend on the answers, as item analysis assumes
+ITEM_BLOCK_SIZE = 512  # Questions analysed at a time, bounding the size of the temporaries
+ITEM_GROUP_FRACTION = 0.27  # Kelley's upper and lower groups, for the discrimination index
+ITEM_MIN_RESPONSES = 20  # Fewer responses than this and a question is not flagged
+ITEM_FLAG_MIN_P = 0.2  # Harder than this, or easier than ITEM_FLAG_MAX_P, and a question is flagged
+ITEM_FLAG_MAX_P = 0.9
+ITEM_FLAG_MIN_DISCRIMINATION = 0.2
+ITEM_FLAG_MIN_POINT_BISERIAL = 0.15
+ITEM_FLAG_MIN_DISTRACTOR_SHARE = 0.05  # A wrong option chosen less often than this is not distracting anyone
+ITEM_FLAG_MAX_DISTRACTOR_DISCRIMINATION = 0.05  # A wrong option favoured this much by the top group suggests a miskey
+
+def results_path(filename, question_prefix, option_prefixes, answer_prefix, results_dir=RESULTS_DIR):
+    """Return the results log for a question file and prefix configuration."""
+    return os.path.join(results_dir, source_key(filename, question_prefix, option_prefixes, answer_prefix) + '.results')
+
+def unpack_results_header(header):
+    """Check the header read from a results log, returning the log's id."""
+    if len(header) < RESULTS_HEADER.size:
+        raise ValueError("Not a results log, or from another version of the app.")
+    magic, version, log_id = RESULTS_HEADER.unpack(header)
+    if magic != RESULTS_MAGIC or version != RESULTS_VERSION:
+        raise ValueError("Not a results log, or from another version of the app.")
+    return log_id
+
+def append_results(path, responses, mode='shuffled'):
+    """Add one student's (question_id, mask) responses to a results log, returning the student's number.
+
+    The log is a RESULTS_HEADER followed by fixed-size RESULT_RECORDs, each
+    carrying the session's mode from RESULT_MODES; students are numbered
+    from 0 in the order they are added. A record torn by a crash is dropped.
+    """
+    mode = RESULT_MODES.index(mode)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        file = open(path, 'r+b')
+    except FileNotFoundError:
+        file = open(path, 'w+b')
+    with file:
+        header = file.read(RESULTS_HEADER.size)
+        if not header:
+            file.write(RESULTS_HEADER.pack(RESULTS_MAGIC, RESULTS_VERSION, random.getrandbits(64)))
+        else:
+            unpack_results_header(header)
+
+        records = (file.seek(0, os.SEEK_END) - RESULTS_HEADER.size) // RESULT_RECORD.size
+        student = 0
+        if records:
+            file.seek(RESULTS_HEADER.size + (records - 1) * RESULT_RECORD.size)
+            student = RESULT_RECORD.unpack(file.read(RESULT_RECORD.size))[0] + 1
+        file.truncate(RESULTS_HEADER.size + records * RESULT_RECORD.size)
+        file.seek(0, os.SEEK_END)
+        file.write(b''.join(RESULT_RECORD.pack(student, question_id, mask, mode) for question_id, mask in responses))
+    return student
+
+def read_results(path):
+    """Read a results log as parallel NumPy arrays of students, question ids, masks and session modes.
+
+    The arrays are views of a memory mapping of the log, so a caller that
+    only looks at some of the records only reads those pages.
+    """
+    if numpy is None:
+        raise ValueError("Item analysis needs NumPy. Install it with: pip install numpy")
+    dtype = numpy.dtype({'names': ['student', 'item', 'mask', 'mode'], 'formats': ['<u4', '<u4', '<u8', 'u1'],
+                         'offsets': [0, 4, 8, 16], 'itemsize': RESULT_RECORD.size})
+    with open(path, 'rb') as file:
+        unpack_results_header(file.read(RESULTS_HEADER.size))
+        count = (file.seek(0, os.SEEK_END) - RESULTS_HEADER.size) // RESULT_RECORD.size  # Less a torn record
+    if count:
+        records = numpy.memmap(path, dtype, 'r', offset=RESULTS_HEADER.size, shape=count)
+    else:
+        records = numpy.zeros(0, dtype)  # An empty mapping is an error
+    return records['student'], records['item'], records['mask'], records['mode']
+
+def select_results(students, items, masks, modes, wanted=FIXED_FORM_MODES):
+    """Keep the responses of sessions in the wanted modes, renumbering their students from 0.
+
+    Adaptive and review sessions pick questions by the answers given, so
+    their responses would bias classical item statistics.
+    """
+    kept = numpy.isin(modes, [RESULT_MODES.index(mode) for mode in wanted])
+    if kept.all():
+        return students, items, masks
+    students = numpy.unique(students[kept], return_inverse=True)[1].astype(numpy.uint32)
+    return students, items[kept], masks[kept]
+
+def item_analysis(bank, students, items, masks, block_size=ITEM_BLOCK_SIZE):
+    """Classical test statistics for every question of bank, from responses given as parallel arrays.
+
+    The responses are put into a dense students x questions matrix of the
+    selected masks, in the narrowest unsigned type with a bit to spare, so
+    a value with every bit set can mark a question the student wasn't
+    asked. The statistics are then column operations over blocks of
+    block_size questions. Returns a dict of 'students', the number of
+    students, and arrays indexed by question id:
+
+        responses              students asked the question
+        p_value                share of them answering it right
+        discrimination         p_value among the top ITEM_GROUP_FRACTION of students by score,
+                               less p_value among the bottom one
+        point_biserial         correlation of answering it right with the share right of the other questions asked
+        option_share           (questions x options) share of students selecting each option
+        option_discrimination  (questions x options) share of the top group selecting each option,
+                               less the share of the bottom group
+    """
+    if numpy is None:
+        raise ValueError("Item analysis needs NumPy. Install it with: pip install numpy")
+    item_count = len(bank)
+    option_counts = numpy.diff(numpy.asarray(bank.record_index, numpy.int64)) - 1
+    max_options = int(option_counts.max()) if item_count else 0
+    dtype = next(t for t in (numpy.uint8, numpy.uint16, numpy.uint32, numpy.uint64) if numpy.iinfo(t).bits > max_options)
+    missing = numpy.iinfo(dtype).max
+    keys = numpy.asarray(bank.answer_masks, numpy.uint64)
+    keys = numpy.where(keys >> numpy.uint64(max_options), missing, keys).astype(dtype)  # An ungradable key matches nothing
+
+    known = items < item_count  # Questions since removed from the file are left out
+    student_count = int(students.max()) + 1 if len(students) else 0
+    matrix = numpy.full((student_count, item_count), missing, dtype)
+    matrix[students[known], items[known]] = (masks[known] & numpy.uint64(int(missing) >> 1)).astype(dtype)
+
+    def blocks():
+        for start in range(0, item_count, block_size):
+            block = matrix[:, start:start + block_size]
+            presented = block != missing
+            yield slice(start, start + block_size), block, presented, (block == keys[start:start + block_size]) & presented
+
+    # Scores first, to rank the students and correlate each question with the rest
+    scores = numpy.zeros(student_count, numpy.float64)
+    asked = numpy.zeros(student_count, numpy.float64)
+    for _, _, presented, correct in blocks():
+        scores += numpy.count_nonzero(correct, axis=1)
+        asked += numpy.count_nonzero(presented, axis=1)
+    ranking = numpy.argsort(scores / numpy.maximum(asked, 1), kind='stable')
+    group_size = max(int(round(student_count * ITEM_GROUP_FRACTION)), 1)
+    lower = numpy.zeros(student_count, numpy.float32)
+    upper = numpy.zeros(student_count, numpy.float32)
+    lower[ranking[:group_size]] = 1
+    upper[ranking[-group_size:]] = 1
+    # Rest scores as a proportion of the other questions asked, as sessions of different lengths share a log;
+    # shifted by their mean, which leaves the correlations unchanged, to keep the float32 sums accurate
+    has_rest = asked > 1
+    rest_weight = numpy.where(has_rest, 1 / numpy.maximum(asked - 1, 1), 0)
+    shift = (scores * rest_weight)[has_rest].mean() if has_rest.any() else 0
+    centered = numpy.where(has_rest, scores * rest_weight - shift, 0)
+    over_asked = numpy.stack([has_rest, centered, centered * centered]).astype(numpy.float32)
+    over_correct = numpy.stack([has_rest, rest_weight, centered, centered * rest_weight,
+                                rest_weight * rest_weight]).astype(numpy.float32)
+
+    responses = numpy.zeros(item_count, numpy.int64)
+    p_value = numpy.full(item_count, numpy.nan)
+    discrimination = numpy.full(item_count, numpy.nan)
+    point_biserial = numpy.full(item_count, numpy.nan)
+    option_share = numpy.zeros((item_count, max_options))
+    option_discrimination = numpy.zeros((item_count, max_options))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        for columns, block, presented, correct in blocks():
+            asked_f = presented.astype(numpy.float32)
+            correct_f = correct.astype(numpy.float32)
+            n = asked_f.sum(axis=0, dtype=numpy.float64)
+            right = correct_f.sum(axis=0, dtype=numpy.float64)
+            responses[columns] = n
+            p_value[columns] = right / n
+
+            upper_n, lower_n = upper @ asked_f, lower @ asked_f
+            discrimination[columns] = (upper @ correct_f) / upper_n - (lower @ correct_f) / lower_n
+
+            # Pearson correlation of x (1 if right) with the rest score y = (score - x) / (asked - 1),
+            # over the students asked this and another question: with c the centered score times
+            # w = 1 / (asked - 1), y = c - w x, and as x * x = x every sum is a product with x or 1
+            n_rest, sum_c, sum_cc = (over_asked @ asked_f).astype(numpy.float64)
+            right_rest, sum_wx, sum_cx, sum_cwx, sum_wwx = (over_correct @ correct_f).astype(numpy.float64)
+            sum_y = sum_c - sum_wx
+            sum_xy = sum_cx - sum_wx
+            sum_yy = sum_cc - 2 * sum_cwx + sum_wwx
+            point_biserial[columns] = (n_rest * sum_xy - right_rest * sum_y) / numpy.sqrt(
+                (n_rest * right_rest - right_rest * right_rest) * (n_rest * sum_yy - sum_y * sum_y))
+
+            for option in range(max_options):
+                chosen = ((block >> dtype(option)) & dtype(1)).astype(bool)
+                chosen &= presented
+                chosen_f = chosen.astype(numpy.float32)
+                option_share[columns, option] = chosen_f.sum(axis=0, dtype=numpy.float64) / n
+                option_discrimination[columns, option] = (upper @ chosen_f) / upper_n - (lower @ chosen_f) / lower_n
+
+    beyond = numpy.arange(max_options) >= option_counts[:, None]
+    option_share[beyond] = 0
+    option_discrimination[beyond] = 0
+    return {
+        'students': student_count,
+        'responses': responses,
+        'p_value': p_value,
+        'discrimination': discrimination,
+        'point_biserial': point_biserial,
+        'option_share': numpy.nan_to_num(option_share),
+        'option_discrimination': numpy.nan_to_num(option_discrimination),
+    }
+
+def flag_items(bank, stats):
+    """Return (question_id, reasons) for each question whose statistics suggest it is flawed."""
+    flagged = []
+    for question_id in numpy.flatnonzero(stats['responses'] >= ITEM_MIN_RESPONSES):
+        question_id = int(question_id)
+        p_value = stats['p_value'][question_id]
+        discrimination = stats['discrimination'][question_id]
+        point_biserial = stats['point_biserial'][question_id]
+        reasons = []
+        if p_value < ITEM_FLAG_MIN_P:
+            reasons.append(f"too hard (p {p_value:.2f})")
+        elif p_value > ITEM_FLAG_MAX_P:
+            reasons.append(f"too easy (p {p_value:.2f})")
+        if discrimination < ITEM_FLAG_MIN_DISCRIMINATION:
+            reasons.append(f"discriminates poorly (D {discrimination:+.2f})")
+        if point_biserial < 0:
+            reasons.append(f"negative point-biserial ({point_biserial:+.2f}), may be miskeyed")
+        elif point_biserial < ITEM_FLAG_MIN_POINT_BISERIAL:
+            reasons.append(f"low point-biserial ({point_biserial:+.2f})")
+
+        key = bank.answer_masks[question_id]
+        for option in range(bank.option_count(question_id)):
+            if key >> option & 1 or key == INVALID_ANSWER:
+                continue
+            letter = chr(65 + option)
+            if stats['option_discrimination'][question_id, option] > ITEM_FLAG_MAX_DISTRACTOR_DISCRIMINATION:
+                reasons.append(f"option {letter} draws the top group more than the bottom one")
+            elif stats['option_share'][question_id, option] < ITEM_FLAG_MIN_DISTRACTOR_SHARE:
+                reasons.append(f"option {letter} is hardly ever chosen")
+        if reasons:
+            flagged.append((question_id, reasons))
+    return flagged
+
+def write_item_report(file, bank, stats, question_ids, reasons=None):
+    """Write the statistics of the given questions as CSV, with the reasons each was flagged."""
+    writer = csv.writer(file)
+    writer.writerow(["question", "line", "responses", "p_value", "discrimination", "point_biserial",
+                     "options", "flags", "text"])
+    line_numbers = getattr(bank, 'line_numbers', ())
+    for question_id in question_ids:
+        options = "; ".join(
+            f"{chr(65 + option)}{'*' if bank.answer_masks[question_id] >> option & 1 else ''} "
+            f"{stats['option_share'][question_id, option]:.2f} {stats['option_discrimination'][question_id, option]:+.2f}"
+            for option in range(bank.option_count(question_id)))
+        writer.writerow([
+            question_id + 1,
+            line_numbers[question_id] if question_id < len(line_numbers) else "",
+            int(stats['responses'][question_id]),
+            f"{stats['p_value'][question_id]:.3f}",
+            f"{stats['discrimination'][question_id]:.3f}",
+            f"{stats['point_biserial'][question_id]:.3f}",
+            options,
+            "; ".join(reasons.get(question_id, ())) if reasons else "",
+            bank.question(question_id)[:80],
+        ])
+
+# Scores of a results log under a scoring policy, kept beside it and indexed by question id
+SCORES_MAGIC = b'QUIZSCOR'
+SCORES_VERSION = 2
+SCORES_HEADER = struct.Struct('<8sI4x16sQQQQ')  # magic, version, policy name, log id, records, questions, students
+
+def bit_counts(masks):
+    """Return the number of options selected in each of an array of masks."""
+    if hasattr(numpy, 'bitwise_count'):  # NumPy 2
+        return numpy.bitwise_count(masks)
+    table = numpy.array([bin(byte).count('1') for byte in range(256)], numpy.uint8)
+    return table[numpy.ascontiguousarray(masks, numpy.uint64).view(numpy.uint8)].reshape(-1, 8).sum(axis=1, dtype=numpy.uint8)
+
+def all_or_nothing_array(selected, correct):
+    """all_or_nothing() over arrays of selected and correct masks."""
+    return (selected == correct).astype(numpy.float32)
+
+def partial_credit_array(selected, correct):
+    """partial_credit() over arrays of selected and correct masks."""
+    right = bit_counts(selected & correct).astype(numpy.float32)
+    wrong = bit_counts(selected & ~correct).astype(numpy.float32)
+    credit = numpy.maximum(right - wrong, 0) / numpy.maximum(bit_counts(correct), 1)
+    plain = (correct == numpy.uint64(INVALID_ANSWER)) | (correct == 0)
+    return numpy.where(plain, selected == correct, credit).astype(numpy.float32)
+
+def subset_credit_array(selected, correct):
+    """subset_credit() over arrays of selected and correct masks."""
+    credit = bit_counts(selected).astype(numpy.float32) / numpy.maximum(bit_counts(correct), 1)
+    plain = (correct == numpy.uint64(INVALID_ANSWER)) | (correct == 0) | (selected & ~correct != 0)
+    return numpy.where(plain, selected == correct, credit).astype(numpy.float32)
+
+def negative_marking_array(selected, correct):
+    """negative_marking() over arrays of selected and correct masks."""
+    free = (selected == 0) | (correct == numpy.uint64(INVALID_ANSWER))
+    return numpy.where(selected == correct, 1, numpy.where(free, 0, -NEGATIVE_MARK)).astype(numpy.float32)
+
+# SCORING_POLICIES over whole arrays of responses at once, for rescoring a results log
+ARRAY_SCORING_POLICIES = {
+    'all-or-nothing': all_or_nothing_array,
+    'partial': partial_credit_array,
+    'subset': subset_credit_array,
+    'negative': negative_marking_array,
+}
+
+def scores_path(results, policy_name):
+    """Return the scores kept for a results log under a scoring policy."""
+    return f"{os.path.splitext(results)[0]}.{policy_name}.scores"
+
+class ResultScores:
+    """Points of every response in a results log under one scoring policy, indexed by question id.
+
+    order lists the log's records sorted by question id, and question q's
+    responses are order[offsets[q]:offsets[q + 1]]. points holds each
+    record's points against keys, the answer masks they were scored with,
+    and totals and asked each student's points and number of questions.
+    When a key is fixed, rekey() rescores only the responses to the changed
+    questions and moves the difference into the totals. log_id is the id
+    of the results log scored, so scores of a log since replaced are not
+    taken for its own.
+    """
+
+    def __init__(self, policy_name, keys, order, offsets, points, totals, asked, log_id=0):
+        self.policy_name = policy_name
+        self.policy = ARRAY_SCORING_POLICIES[policy_name]
+        self.keys = keys
+        self.order = order
+        self.offsets = offsets
+        self.points = points
+        self.totals = totals
+        self.asked = asked
+        self.log_id = log_id
+
+    @property
+    def records(self):
+        return len(self.points)
+
+    @classmethod
+    def build(cls, policy_name, keys, students, items, masks):
+        """Score every response to questions with answer masks keys, in one pass."""
+        scores = cls(policy_name, numpy.zeros(0, numpy.uint64), numpy.zeros(0, numpy.uint32),
+                     numpy.zeros(1, numpy.uint64), numpy.zeros(0, numpy.float32),
+                     numpy.zeros(0, numpy.float64), numpy.zeros(0, numpy.uint32))
+        scores.keys = scores.pad_keys(keys, items)
+        scores.extend(students, items, masks)
+        return scores
+
+    def pad_keys(self, keys, items):
+        """Return keys as an array covering every question answered in items; questions since removed match nothing."""
+        count = max(len(keys), int(items.max()) + 1 if len(items) else 0, len(self.keys))
+        padded = numpy.full(count, INVALID_ANSWER, numpy.uint64)
+        padded[:len(keys)] = numpy.asarray(keys, numpy.uint64)
+        return padded
+
+    def extend(self, students, items, masks):
+        """Score the records of the log past the ones already scored, and reindex."""
+        start = self.records
+        new_students = numpy.asarray(students[start:], numpy.intp)
+        new_items = numpy.asarray(items[start:], numpy.intp)
+        if not len(new_items):
+            return
+        self.keys = self.pad_keys(self.keys, new_items)
+        points = self.policy(numpy.asarray(masks[start:], numpy.uint64), self.keys[new_items])
+        self.points = numpy.concatenate([self.points, points])
+
+        student_count = max(len(self.totals), int(new_students.max()) + 1)
+        self.totals = numpy.pad(self.totals, (0, student_count - len(self.totals)))
+        self.asked = numpy.pad(self.asked, (0, student_count - len(self.asked)))
+        self.totals += numpy.bincount(new_students, points, student_count)
+        self.asked += numpy.bincount(new_students, minlength=student_count).astype(numpy.uint32)
+
+        # Stable, so each question's responses stay in log order
+        items = numpy.asarray(items[:self.records], numpy.intp)
+        self.order = numpy.argsort(items, kind='stable').astype(numpy.uint32)
+        self.offsets = numpy.zeros(len(self.keys) + 1, numpy.uint64)
+        numpy.cumsum(numpy.bincount(items, minlength=len(self.keys)), out=self.offsets[1:])
+
+    def rekey(self, keys, students, items, masks):
+        """Rescore the responses to the questions whose answer masks differ from keys.
+
+        Returns the number of questions changed and of responses rescored.
+        """
+        keys = self.pad_keys(keys, numpy.zeros(0, numpy.intp))
+        changed = numpy.flatnonzero(keys[:len(self.keys)] != self.keys)
+        self.keys = keys
+        self.offsets = numpy.pad(self.offsets, (0, len(keys) + 1 - len(self.offsets)), 'edge')  # Added questions, unanswered
+        if not len(changed):
+            return 0, 0
+
+        # The changed questions' slices of order, gathered in one go
+        starts = self.offsets[changed].astype(numpy.intp)
+        lengths = self.offsets[changed + 1].astype(numpy.intp) - starts
+        ends = numpy.cumsum(lengths)
+        positions = numpy.arange(int(ends[-1])) + numpy.repeat(starts - (ends - lengths), lengths)
+        records = numpy.sort(self.order[positions])  # In log order, for locality in the mapping
+        if not len(records):
+            return len(changed), 0
+
+        points = self.policy(numpy.asarray(masks[records], numpy.uint64), keys[numpy.asarray(items[records], numpy.intp)])
+        difference = points.astype(numpy.float64) - self.points[records]
+        self.points[records] = points
+        self.totals += numpy.bincount(numpy.asarray(students[records], numpy.intp), difference, len(self.totals))
+        return len(changed), len(records)
+
+    @classmethod
+    def load(cls, path, policy_name):
+        """Read the scores at path, kept under policy_name."""
+        with open(path, 'rb') as file:
+            header = file.read(SCORES_HEADER.size)
+            if len(header) < SCORES_HEADER.size:
+                raise ValueError("Not a scores file.")
+            magic, version, name, log_id, records, questions, students = SCORES_HEADER.unpack(header)
+            if magic != SCORES_MAGIC or version != SCORES_VERSION or name.rstrip(b'\0').decode() != policy_name:
+                raise ValueError("Not a scores file, or from another version of the app.")
+
+            def column(dtype, count):
+                values = numpy.fromfile(file, dtype, count)
+                if len(values) != count:
+                    raise ValueError("Scores file is truncated.")
+                return values
+
+            return cls(policy_name, column(numpy.uint64, questions), column(numpy.uint32, records),
+                       column(numpy.uint64, questions + 1), column(numpy.float32, records),
+                       column(numpy.float64, students), column(numpy.uint32, students), log_id)
+
+    def save(self, path):
+        """Write the scores to path atomically."""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(SCORES_HEADER.pack(SCORES_MAGIC, SCORES_VERSION, self.policy_name.encode(), self.log_id,
+                                              self.records, len(self.keys), len(self.totals)))
+                for values in (self.keys, self.order, self.offsets, self.points, self.totals, self.asked):
+                    values.tofile(file)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+def rescore_results(bank, results, policy_name='all-or-nothing'):
+    """Bring the scores of the results log at results up to date with bank's answers, under a scoring policy.
+
+    Responses logged since the scores were last kept are scored, and those
+    to questions whose answer has changed are rescored; the rest are left
+    alone. Scores that are missing, or kept from a log since replaced, are
+    built in one pass over the whole log. Returns the scores and the number
+    of questions changed and responses rescored, or None for both when the
+    scores were built afresh.
+    """
+    with open(results, 'rb') as file:
+        log_id = unpack_results_header(file.read(RESULTS_HEADER.size))
+    students, items, masks, _ = read_results(results)
+    path = scores_path(results, policy_name)
+    try:
+        scores = ResultScores.load(path, policy_name)
+    except (OSError, ValueError):
+        scores = None
+    if scores is None or scores.log_id != log_id or scores.records > len(items):
+        scores = ResultScores.build(policy_name, bank.answer_masks, students, items, masks)
+        scores.log_id = log_id
+        changed = rescored = None
+    else:
+        changed, rescored = scores.rekey(bank.answer_masks, students, items, masks)
+        scores.extend(students, items, masks)
+    scores.save(path)
+    return scores, changed, rescored
+
+# Paper answer sheets, scanned to CSV, are graded in batches across worker processes
+GRADE_BATCH_SIZE = 2000  # Sheets handed to a worker at a time
+
+def grade_sheet_batch(rows, keys, policy_name):
+    """Grade (line, row) answer sheets from a CSV against keys, the answer masks of the questions in file order.
+
+    Each row holds a student id, then one answer per question, written any
+    way answer_mask reads ("AC", "A, C"); a missing or empty answer is
+    blank. An answer that can't be read is never right. Returns a list of
+    (student, score, points, answered, unreadable) per sheet, with points
+    given by the named policy from SCORING_POLICIES, for each question a
+    dict of how many sheets selected each mask, and a list of (line, reason)
+    for the rows skipped.
+    """
+    policy = SCORING_POLICIES[policy_name]
+    question_count = len(keys)
+    selections = [{} for _ in range(question_count)]
+    masks = {'': 0}  # Answer text -> mask; sheets repeat the same few answers
+    sheets = []
+    skipped = []
+    for line, row in rows:
+        if not row:
+            skipped.append((line, "blank row"))
+            continue
+        score = answered = unreadable = 0
+        points = 0.0
+        for question_id, text in enumerate(row[1:question_count + 1]):
+            mask = masks.get(text)
+            if mask is None:
+                mask = masks[text] = answer_mask(text)
+            counts = selections[question_id]
+            counts[mask] = counts.get(mask, 0) + 1
+            if mask == INVALID_ANSWER:
+                unreadable += 1
+                continue
+            answered += mask != 0
+            key = keys[question_id]
+            if mask == key:
+                score += 1
+            if policy is not all_or_nothing:
+                points += policy(mask, key)
+        sheets.append((row[0], score, score if policy is all_or_nothing else points, answered, unreadable))
+    return sheets, selections, skipped
+
+def grade_sheets(bank, lines, on_sheets, policy_name='all-or-nothing', workers=None, batch_size=GRADE_BATCH_SIZE,
+                 header=True, on_skipped=None):
+    """Grade an iterable of CSV answer sheet lines against bank, streaming the scores to on_sheets.
+
+    Rows are read batch_size at a time and graded across workers
+    processes, with a few batches in flight so memory stays flat however
+    many sheets there are; on_sheets is called with each batch's list of
+    sheets, in input order. The CSV is read here rather than by the
+    workers, so a quoted answer spanning lines is never cut between batches. With header, the first line is a header and not
+    a sheet. on_skipped, if given, is called with the line number and reason
+    of every row not graded, the header included. Returns the number of
+    sheets and, for each question, how many sheets selected each mask.
+    """
+    keys = list(bank.answer_masks)
+    reader = csv.reader(lines)
+
+    def numbered_rows():
+        line = 1
+        for row in reader:
+            yield line, row
+            line = reader.line_num + 1  # A quoted answer may span lines
+
+    rows = numbered_rows()
+    if header and next(rows, None) is not None and on_skipped is not None:
+        on_skipped(1, "header")
+
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = deque()
+    selections = [Counter() for _ in keys]
+    count = 0
+
+    def collect(result):
+        nonlocal count
+        sheets, batch_selections, skipped = result
+        for counts, batch_counts in zip(selections, batch_selections):
+            counts.update(batch_counts)
+        count += len(sheets)
+        if on_skipped is not None:
+            for skipped_line, reason in skipped:
+                on_skipped(skipped_line, reason)
+        on_sheets(sheets)
+
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            if executor is None:
+                collect(grade_sheet_batch(batch, keys, policy_name))
+                continue
+            pending.append(executor.submit(grade_sheet_batch, batch, keys, policy_name))
+            if len(pending) >= 2 * workers:
+                collect(pending.popleft().result())
+        while pending:
+            collect(pending.popleft().result())
+    finally:
+        if executor is not None:
+            for task in pending:
+                task.cancel()
+            executor.shutdown()
+    return count, selections
+
+def write_grade_stats(file, bank, count, selections):
+    """Write per-question statistics of graded sheets as CSV: how many answered, got it right, and chose each option."""
+    writer = csv.writer(file)
+    writer.writerow(["question", "key", "answered", "right", "p_value", "unreadable", "options"])
+    for question_id, counts in enumerate(selections):
+        key = bank.answer_masks[question_id]
+        right = counts.get(key, 0) if key != INVALID_ANSWER else 0
+        chosen = [0] * bank.option_count(question_id)
+        for mask, sheets in counts.items():
+            if mask != INVALID_ANSWER:
+                for option in range(len(chosen)):
+                    if mask >> option & 1:
+                        chosen[option] += sheets
+        writer.writerow([
+            question_id + 1,
+            bank.answer(question_id).strip(),
+            sum(sheets for mask, sheets in counts.items() if mask and mask != INVALID_ANSWER),
+            right,
+            f"{right / count:.3f}" if count else "",
+            counts.get(INVALID_ANSWER, 0),
+            "; ".join(f"{chr(65 + option)}{'*' if key >> option & 1 else ''} {sheets / count if count else 0:.2f}"
+                      for option, sheets in enumerate(chosen)),
+        ])
+
+HISTOGRAM_SUB_BUCKET_BITS = 5  # 32 buckets per power of two, so about 3% resolution
+DEBUG_METRICS_DIR = os.path.join(os.path.expanduser("~"), ".quizapp", "metrics")
+DEBUG_OVERLAY_MS = 500  # How often the debug overlay refreshes
+DEBUG_CALLBACKS = ('load_questions_from_file', 'check_answer', 'load_question', 'finish_quiz', 'update_progress_bar')
+
+class LatencyHistogram:
+    """HDR-style histogram of durations in ns, with a fixed relative error.
+
+    Values below 2 ** (HISTOGRAM_SUB_BUCKET_BITS + 1) get a bucket each; above
+    that every power of two is split into 2 ** HISTOGRAM_SUB_BUCKET_BITS
+    buckets, so memory stays bounded however many values are recorded.
+    """
+
+    def __init__(self):
+        self.counts = array('Q')
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        """Bucket index for a value."""
+        shift = max(value.bit_length() - HISTOGRAM_SUB_BUCKET_BITS - 1, 0)
+        return (shift << HISTOGRAM_SUB_BUCKET_BITS) + (value >> shift)
+
+    @staticmethod
+    def highest_value(index):
+        """Largest value that falls in a bucket."""
+        shift = max((index >> HISTOGRAM_SUB_BUCKET_BITS) - 1, 0)
+        return ((index - (shift << HISTOGRAM_SUB_BUCKET_BITS)) << shift) + (1 << shift) - 1
+
+    def record(self, value):
+        index = self.bucket(value)
+        if index >= len(self.counts):
+            self.counts.frombytes(bytes(8 * (index + 1 - len(self.counts))))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Value at or below which percent of the recorded values fall."""
+        if not self.count:
+            return 0
+        rank = max(math.ceil(percent / 100 * self.count), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.highest_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """Count, mean, extremes and p50/p95/p99, in ns."""
+        return {
+            'count': self.count,
+            'mean_ns': self.total // self.count if self.count else 0,
+            'min_ns': self.min or 0,
+            'max_ns': self.max,
+            'p50_ns': self.percentile(50),
+            'p95_ns': self.percentile(95),
+            'p99_ns': self.percentile(99),
+        }
+
+class DebugMetrics:
+    """Latency histograms for the UI, by name.
+
+    wrap() times a callback with perf_counter_ns, and also the time from its
+    start until Tk next goes idle, recorded as "<name> to idle".
+    """
+
     def __init__(self, root):
+        self.root = root
+        self.histograms = {}
+
+    def record(self, name, duration):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record(duration)
+
+    def wrap(self, name, callback):
+        """Return callback, timed under name."""
+        def timed(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter_ns() - start)
+                self.root.after_idle(self.record_idle, name, start)
+        return timed
+
+    def record_idle(self, name, start):
+        self.record(f"{name} to idle", time.perf_counter_ns() - start)
+
+    def summary(self):
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def report(self):
+        """Format the histograms as a fixed-width table in ms."""
+        lines = [f"{'':<28}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+        for name, stats in self.summary().items():
+            lines.append(f"{name:<28}{stats['count']:>7}" + "".join(
+                f"{stats[key] / 1e6:>9.3f}" for key in ('p50_ns', 'p95_ns', 'p99_ns', 'max_ns')))
+        return "\n".join(lines)
+
+    def dump(self, path, counts=None):
+        """Write the histograms, event counts and a description of the machine as JSON."""
+        data = {
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'machine': {
+                'platform': platform.platform(),
+                'processor': platform.processor(),
+                'cpus': os.cpu_count(),
+                'python': platform.python_version(),
+                'tk': str(self.root.tk.call('info', 'patchlevel')),
+            },
+            'histograms': self.summary(),
+            'counts': dict(counts or {}),
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(data, file, indent=2)
+
+def mask_letters(mask):
+    """Spell an answer mask as option letters, e.g. 0b101 as "A, C"."""
+    return ", ".join(chr(65 + i) for i in range(mask.bit_length()) if mask >> i & 1) or "none"
+
+class ReviewList:
+    """Scrolling list of answered questions that only draws the rows in view.
+
+    Each row is a question id and the answer mask that was selected; the text
+    is looked up in the bank when the row scrolls into view. A fixed pool of
+    canvas items, enough to fill the window, is moved and retexted as the list
+    scrolls, so the cost does not depend on the number of rows.
+    """
+
+    def __init__(self, parent, bank, ids, selections, font):
+        self.bank = bank
+        self.ids = ids  # Row -> question id
+        self.selections = selections  # Row -> selected answer mask
+        self.font = font
+        self.row_height = 2 * font.metrics("linespace") + 12
+        self.char_width = font.measure("0")
+        self.rows = []  # Pooled (question, answer, separator) canvas items, one per visible row
+        self.first_row = None
+
+        self.canvas = Canvas(parent, bg="white", highlightthickness=0, yscrollincrement=self.row_height)
+        self.scrollbar = Scrollbar(parent, orient="vertical", command=self.yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set, scrollregion=(0, 0, 0, len(selections) * self.row_height))
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", lambda e: self.redraw(force=True))
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self.on_wheel)
+
+    def yview(self, *args):
+        """Scroll from the scrollbar, then redraw the rows now in view."""
+        self.canvas.yview(*args)
+        self.redraw()
+
+    def on_wheel(self, event):
+        """Scroll three rows per mouse wheel step."""
+        self.canvas.yview_scroll(-3 if event.num == 4 or event.delta > 0 else 3, "units")
+        self.redraw()
+
+    def redraw(self, force=False):
+        """Point the pooled items at the rows in view, growing the pool if the window grew."""
+        first = int(self.canvas.canvasy(0)) // self.row_height
+        visible = self.canvas.winfo_height() // self.row_height + 2
+        if first == self.first_row and len(self.rows) >= visible and not force:
+            return
+        self.first_row = first
+
+        while len(self.rows) < visible:
+            self.rows.append((self.canvas.create_text(8, 0, anchor="nw", font=self.font),
+                              self.canvas.create_text(8, 0, anchor="nw", font=self.font),
+                              self.canvas.create_line(0, 0, 0, 0, fill="#dddddd")))
+
+        width = self.canvas.winfo_width()
+        limit = max(width // self.char_width - 2, 10)  # Characters that fit on one line
+        for row, (question_item, answer_item, line_item) in enumerate(self.rows, first):
+            if row >= len(self.selections):
+                for item in (question_item, answer_item, line_item):
+                    self.canvas.itemconfigure(item, state="hidden")
+                continue
+
+            question_id = self.ids[row]
+            selected = self.selections[row]
+            text = f"{row + 1}. {' '.join(self.bank.question(question_id).split())}"
+            if len(text) > limit:
+                text = text[:limit - 3] + "..."
+            correct = selected == self.bank.answer_masks[question_id]
+
+            y = row * self.row_height
+            self.canvas.coords(question_item, 8, y + 4)
+            self.canvas.itemconfigure(question_item, text=text, state="normal")
+            self.canvas.coords(answer_item, 8, y + 4 + self.row_height // 2 - 4)
+            self.canvas.itemconfigure(answer_item, state="normal", fill="#2e7d32" if correct else "#c62828",
+                                      text=f"Your answer: {mask_letters(selected)} | Correct answer(s): {self.bank.answer(question_id).strip()}")
+            self.canvas.coords(line_item, 0, y + self.row_height - 1, width, y + self.row_height - 1)
+            self.canvas.itemconfigure(line_item, state="normal")
+
+class QuestionPage:
+    """The widgets for one question: a label and a pool of option rows, in their own frame.
+
+    QuizApp keeps two pages, showing one while the next question is built
+    in the other, so moving on is a swap of frames.
+    """
+
+    def __init__(self, parent, font):
+        self.frame = tk.Frame(parent, bg="#f0f0f0")
+        self.label = tk.Label(self.frame, wraplength=550, font=font, bg="#f0f0f0", anchor="w")
+        self.label.pack(pady=10)
+        self.option_buttons = []  # One Checkbutton per option row, grown on demand
+        self.check_vars = []  # Track the states of checkboxes, one per option row
+        self.shown_options = 0  # Option rows currently packed
+        self.bank = None  # Bank and id of the question the widgets hold
+        self.question_id = None
+
+    def holds(self, bank, question_id):
+        """Whether the page is already built for this question."""
+        return self.bank is bank and self.question_id == question_id
+
+    def fill(self, bank, question_id):
+        """Configure the widgets for a question, with every option unticked."""
+        question_data = bank[question_id]
+        self.label.config(text=question_data['question'])
+
+        options = question_data['options']
+        self.show_options(len(options))
+        for check_button, var, option in zip(self.option_buttons, self.check_vars, options):
+            check_button.config(text=option, state=tk.NORMAL)
+            var.set(False)  # Reset checkbox states for new question
+        self.bank = bank
+        self.question_id = question_id
+
+    def show_options(self, count):
+        """Show the first count option rows, creating rows the pool does not have yet."""
+        while len(self.option_buttons) < count:
+            var = tk.BooleanVar()  # Variable for the checkbox state
+            self.check_vars.append(var)
+            self.option_buttons.append(tk.Checkbutton(self.frame, variable=var, bg="#f0f0f0"))
+
+        # Rows are only ever added or removed at the end, so packing order stays intact
+        for check_button in self.option_buttons[self.shown_options:count]:
+            check_button.pack(anchor=tk.W, pady=5)
+        for check_button in self.option_buttons[count:self.shown_options]:
+            check_button.pack_forget()
+        self.shown_options = count
+
+    def selected_mask(self):
+        """Pack the checkbox states into a mask, bit i for option chr(65 + i)."""
+        return sum(1 << i for i, var in enumerate(self.check_vars[:self.shown_options]) if var.get())
+
+class QuizApp:
+    def __init__(self, root, debug=False):
         """Initialize the main application window."""
         self.root = root
+        self.debug = debug
+        self.metrics = DebugMetrics(root)  # Page builds and swaps are always timed; debug mode times callbacks too
+        if debug:
+            # Before any widget is created, so button commands are bound to the timed callbacks
+            for name in DEBUG_CALLBACKS:
+                setattr(self, name, self.metrics.wrap(name, getattr(self, name)))
         self.root.title("Dynamic Quiz App")
         self.root.geometry("600x500")
         self.root.config(bg="#f0f0f0")
 
+        # Named fonts, created once and shared by every widget
+        self.title_font = tkfont.Font(root=self.root, family="Arial", size=24, weight="bold")
+        self.result_font = tkfont.Font(root=self.root, family="Arial", size=16)
+        self.large_font = tkfont.Font(root=self.root, family="Arial", size=14)
+        self.body_font = tkfont.Font(root=self.root, family="Arial", size=12)
+
         # Create a canvas for scrolling
         self.canvas = Canvas(self.root, bg="#f0f0f0")
         self.scrollbar = Scrollbar(self.root, orient="vertical", command=self.canvas.yview)
         self.scrollable_frame = tk.Frame(self.canvas, bg="#f0f0f0")
 
-        # Configure the scrollable frame
-        self.scrollable_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
+        # Configure the scrollable frame; bursts of resizes share one scroll region update
+        self.event_counts = Counter()  # UI events received and the redraws they caused
+        self.scroll_job = None
+        self.stats_job = None
+        self.scrollable_frame.bind("<Configure>", self.schedule_scroll_region)
         self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
 
         self.canvas.pack(side="left", fill="both", expand=True)
@@ -103,34 +2672,57 @@ class QuizApp:
         self.canvas.configure(yscrollcommand=self.scrollbar.set)
 
         # Title Label
-        self.title_label = tk.Label(self.scrollable_frame, text="Quiz App", font=("Arial", 24, "bold"), bg="#f0f0f0", fg="#333")
+        self.title_label = tk.Label(self.scrollable_frame, text="Quiz App", font=self.title_font, bg="#f0f0f0", fg="#333")
         self.title_label.pack(pady=10)
 
         # Input for prefixes
-        self.question_prefix_entry = tk.Entry(self.scrollable_frame, font=("Arial", 12), width=40)
+        self.question_prefix_entry = tk.Entry(self.scrollable_frame, font=self.body_font, width=40)
         self.question_prefix_entry.pack(pady=5)
-        self.question_prefix_entry.insert(0, "Question Prefix,NO.")  # Default prefix
+        self.question_prefix_entry.insert(0, DEFAULT_QUESTION_PREFIX)
 
-        self.option_prefixes_entry = tk.Entry(self.scrollable_frame, font=("Arial", 12), width=40)
+        self.option_prefixes_entry = tk.Entry(self.scrollable_frame, font=self.body_font, width=40)
         self.option_prefixes_entry.pack(pady=5)
-        self.option_prefixes_entry.insert(0, "A., B., C., D.")  # Default option prefixes
+        self.option_prefixes_entry.insert(0, DEFAULT_OPTION_PREFIXES)
 
-        self.answer_prefix_entry = tk.Entry(self.scrollable_frame, font=("Arial", 12), width=40)
+        self.answer_prefix_entry = tk.Entry(self.scrollable_frame, font=self.body_font, width=40)
         self.answer_prefix_entry.pack(pady=5)
-        self.answer_prefix_entry.insert(0, "Answer:")  # Default answer prefix
+        self.answer_prefix_entry.insert(0, DEFAULT_ANSWER_PREFIX)
+
+        self.quiz_size_entry = tk.Entry(self.scrollable_frame, font=self.body_font, width=40)
+        self.quiz_size_entry.pack(pady=5)
+        self.quiz_size_entry.insert(0, "All")  # Questions per quiz, or All for the whole bank
+
+        # Pause on the answered question before moving on, instead of advancing at once
+        self.pause_var = tk.BooleanVar()
+        self.pause_check = tk.Checkbutton(self.scrollable_frame, text="Pause on feedback before the next question", variable=self.pause_var, font=self.body_font, bg="#f0f0f0")
+        self.pause_check.pack(pady=5)
+
+        # Which questions to ask: a shuffled pass over the bank, the ones due for review, or an adaptive drill
+        self.mode_var = tk.StringVar(value='shuffled')
+        self.mode_frame = tk.Frame(self.scrollable_frame, bg="#f0f0f0")
+        self.mode_frame.pack(pady=5)
+        for mode, text in (('shuffled', "Shuffled"), ('review', "Spaced repetition"), ('adaptive', "Adaptive")):
+            tk.Radiobutton(self.mode_frame, text=text, variable=self.mode_var, value=mode, font=self.body_font, bg="#f0f0f0").pack(side="left", padx=5)
 
         # Load Questions Button
-        self.load_button = tk.Button(self.scrollable_frame, text="Load Questions", command=self.load_questions_from_file, bg="#4CAF50", fg="white", font=("Arial", 14))
+        self.load_button = tk.Button(self.scrollable_frame, text="Load Questions", command=self.load_questions_from_file, bg="#4CAF50", fg="white", font=self.large_font)
         self.load_button.pack(pady=10)
 
+        # Resume the last session from its journal, shown while there is one to resume
+        self.resume_button = tk.Button(self.scrollable_frame, text="Resume Session", command=self.resume_session, bg="#2196F3", fg="white", font=self.body_font)
+
+        # Loading status and cancel button, shown while a bank loads in the background
+        self.load_status_label = tk.Label(self.scrollable_frame, text="", font=self.body_font, bg="#f0f0f0")
+        self.cancel_button = tk.Button(self.scrollable_frame, text="Cancel Loading", command=self.cancel_loading, bg="#f44336", fg="white", font=self.body_font)
+
         # Score and Percentage Labels
-        self.score_label = tk.Label(self.scrollable_frame, text=f"Score: 0", font=("Arial", 14), bg="#f0f0f0")
+        self.score_label = tk.Label(self.scrollable_frame, text=f"Score: 0", font=self.large_font, bg="#f0f0f0")
         self.score_label.pack(pady=5)
 
-        self.attempted_label = tk.Label(self.scrollable_frame, text="Total Attempted: 0 | Total Incorrect: 0 | Percentage Incorrect: 0%", font=("Arial", 12), bg="#f0f0f0")
+        self.attempted_label = tk.Label(self.scrollable_frame, text="Total Attempted: 0 | Total Incorrect: 0 | Percentage Incorrect: 0%", font=self.body_font, bg="#f0f0f0")
         self.attempted_label.pack(pady=5)
 
-        self.questions_left_label = tk.Label(self.scrollable_frame, text="Questions Left: 0", font=("Arial", 12), bg="#f0f0f0")
+        self.questions_left_label = tk.Label(self.scrollable_frame, text="Questions Left: 0", font=self.body_font, bg="#f0f0f0")
         self.questions_left_label.pack(pady=5)
 
         # Progress Bar (Battery-like)
@@ -139,124 +2731,986 @@ class QuizApp:
         self.progress_rect = self.progress_canvas.create_rectangle(0, 0, 0, 40, fill="lightgreen")
 
         # Next button to check the answer
-        self.next_button = tk.Button(self.scrollable_frame, text="Next", command=self.check_answer, bg="#4CAF50", fg="white", font=("Arial", 14))
+        self.next_button = tk.Button(self.scrollable_frame, text="Next", command=self.check_answer, bg="#4CAF50", fg="white", font=self.large_font)
         self.next_button.pack(pady=10)
 
+        # Feedback on the last answer, shown inline so the quiz never waits on a dialog
+        self.feedback_label = tk.Label(self.scrollable_frame, text="", wraplength=550, font=self.large_font, bg="#f0f0f0", fg="white")
+        self.feedback_label.pack(pady=5)
+
         # Question display area
         self.question_frame = tk.Frame(self.scrollable_frame, bg="#f0f0f0")
         self.question_frame.pack(fill=tk.BOTH, expand=True)
 
         # Message Label for loading questions
-        self.message_label = tk.Label(self.question_frame, text="Please load questions to start the quiz.", font=("Arial", 14), bg="#f0f0f0")
+        self.message_label = tk.Label(self.question_frame, text="Please load questions to start the quiz.", font=self.large_font, bg="#f0f0f0")
         self.message_label.pack(pady=10)
 
+        # Question widgets: the page on screen, and a hidden one the next question is built in
+        self.page = QuestionPage(self.question_frame, self.large_font)
+        self.spare = QuestionPage(self.question_frame, self.large_font)
+
+        # Review buttons, shown under the final score
+        self.review_frame = tk.Frame(self.question_frame, bg="#f0f0f0")
+        self.review_all_button = tk.Button(self.review_frame, text="Review All Questions", command=lambda: self.show_review(False), font=self.body_font)
+        self.review_all_button.pack(side="left", padx=5)
+        self.review_wrong_button = tk.Button(self.review_frame, text="Review Wrong Answers", command=lambda: self.show_review(True), font=self.body_font)
+        self.review_wrong_button.pack(side="left", padx=5)
+
         # Other variables
-        self.questions = []
-        self.current_question = 0
-        self.score = 0
-        self.incorrect_answers = []
-        self.attempted = 0
-        self.correct = 0
-        self.incorrect = 0
-        self.check_vars = []  # Track the states of checkboxes
+        self.session = QuizSession(QuestionBank(), array('Q'))  # Scoring and progression; this class only shows it
+        self.loading = False
+        self.load_started = False  # Whether a preview question is already on screen
+        self.load_events = None  # Queue of events from the loading worker
+        self.load_cancel = None  # Set to ask the loading worker to stop
+        self.load_size = 0
+        self.advance_job = None  # Pending after() call that moves on from a paused question
+
+        # Keyboard: A-Z toggle options, Enter submits
+        self.root.bind("<Key>", self.on_key)
+        self.root.bind("<Return>", self.on_return)
+
+        # Debug mode: F12 toggles a latency overlay, and the histograms are saved on exit
+        self.debug_label = None
+        if debug:
+            self.debug_label = tk.Label(self.root, font=tkfont.Font(root=self.root, family="Courier", size=9),
+                                        justify="left", anchor="nw", bg="#222222", fg="#7CFC00")
+            self.root.bind("<F12>", self.toggle_debug_overlay)
+
+        # Answers are journaled so the session survives the window closing
+        self.journal = None
+        self.journal_job = None
+        self.load_settings = None  # Source file and prefixes, seed and quiz size of the bank being loaded
+        self.resume_answers = None  # Answers to replay once a resumed session's bank has loaded
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.update_resume_button()
 
     def load_questions_from_file(self):
-        """Load questions from a file selected by the user."""
-        filename = filedialog.askopenfilename(title="Select a Questions File", filetypes=[("Text files", "*.txt")])
+        """Load questions from a file selected by the user on a background thread."""
+        filename = filedialog.askopenfilename(title="Select a Questions File", filetypes=[("Question files", "*.txt *.pdf *.docx"), ("Text files", "*.txt"), ("PDF files", "*.pdf"), ("Word documents", "*.docx")])
         if filename:
             question_prefix = self.question_prefix_entry.get().strip()
             option_prefixes = [prefix.strip() for prefix in self.option_prefixes_entry.get().split(',')]
             answer_prefix = self.answer_prefix_entry.get().strip()
+            quiz_size = self.quiz_size_entry.get().strip()
+            count = int(quiz_size) if quiz_size.isdigit() and int(quiz_size) > 0 else None
+            seed = random.randrange(2 ** 32)  # The order is regenerated from this alone
+            settings = {'filename': filename, 'question_prefix': question_prefix,
+                        'option_prefixes': option_prefixes, 'answer_prefix': answer_prefix}
+            self.resume_answers = None
+            self.start_loading(settings, seed, count, mode=self.mode_var.get())
+
+    def resume_session(self):
+        """Reload the bank of the journaled session and replay its answers."""
+        try:
+            header, answers = read_journal(SESSION_JOURNAL_PATH)
+            os.path.getsize(header['settings']['filename'])
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not resume the session: {e}")
+            return
+        self.resume_answers = list(zip(answers[::2], answers[1::2]))
+        self.start_loading(header['settings'], header['seed'], header['count'], header['first'])
+
+    def start_loading(self, settings, seed, count, first=None, mode='shuffled'):
+        """Load a bank on a background thread, polling it for progress."""
+        if getattr(self.session.order, 'store', None):
+            self.reset_quiz()  # Let the card store go: the worker may rewrite it, which Windows refuses while it is mapped
+        self.loading = True
+        self.load_started = False
+        self.load_settings = (settings, seed, count)
+        self.load_events = queue.Queue()
+        self.load_cancel = threading.Event()
+        self.load_size = os.path.getsize(settings['filename'])
+        self.load_button['state'] = tk.DISABLED
+        self.resume_button['state'] = tk.DISABLED
+        self.load_status_label.config(text="Loading questions...")
+        self.load_status_label.pack(pady=5, after=self.load_button)
+        self.cancel_button.pack(pady=5, after=self.load_status_label)
 
+        worker = threading.Thread(target=load_questions_in_background, daemon=True,
+                                  args=(self.load_events, self.load_cancel, settings['filename'],
+                                        settings['question_prefix'], settings['option_prefixes'],
+                                        settings['answer_prefix'], seed, count, first, mode))
+        worker.start()
+        self.root.after(LOAD_POLL_MS, self.poll_load_queue)
+
+    def poll_load_queue(self):
+        """Apply the events reported by the loading worker, rescheduling until it finishes."""
+        while True:
             try:
-                self.questions = load_questions(filename, question_prefix, option_prefixes, answer_prefix)
-                self.current_question = 0
-                self.score = 0
-                self.attempted = 0
-                self.correct = 0
-                self.incorrect = 0
-                self.score_label.config(text=f"Score: {self.score}")
-                self.attempted_label.config(text="Total Attempted: 0 | Total Incorrect: 0 | Percentage Incorrect: 0%")
-                self.questions_left_label.config(text=f"Questions Left: {len(self.questions)}")
-                self.load_question()
-            except ValueError as e:
-                messagebox.showerror("Error", str(e))
+                event = self.load_events.get_nowait()
+            except queue.Empty:
+                break
 
-    def load_question(self):
-        """Load and display the current question and its options."""
-        for widget in self.question_frame.winfo_children():
-            widget.destroy()  # Clear previous question and options
+            kind = event[0]
+            if kind == 'header':
+                self.show_bank_header(event[1])
+            elif kind == 'progress':
+                self.load_status_label.config(
+                    text=f"Loading... {event[1] / 1048576:.1f} of {self.load_size / 1048576:.1f} MB read, {event[2]} questions found")
+            elif kind == 'pages':
+                self.load_status_label.config(text=f"Extracting PDF pages... {event[1]} of {event[2]} ({event[3]:.1f} pages/sec)")
+            elif kind == 'preview':
+                # Let the user start on a sampled question while the rest loads
+                self.load_started = True
+                self.start_quiz(event[1], array('Q', [0]))
+            elif kind == 'done':
+                self.end_loading()
+                resume, self.resume_answers = self.resume_answers, None
+                if self.load_started:
+                    self.session.replace_bank(event[1], event[2])
+                    self.schedule_stats()
+                else:
+                    try:
+                        self.start_quiz(event[1], event[2], resume)
+                    except ValueError as e:
+                        self.reset_quiz()
+                        messagebox.showerror("Error", str(e))
+                        return
+                if event[1].problems:
+                    self.show_answer_problems(event[1].problems)
+                self.start_journal(resume is not None)
+                return
+            elif kind in ('error', 'cancelled'):
+                self.end_loading()
+                if self.load_started:
+                    self.reset_quiz()
+                if kind == 'error':
+                    messagebox.showerror("Error", event[1])
+                return
 
-        if self.current_question < len(self.questions):
-            question_data = self.questions[self.current_question]
-            question_label = tk.Label(self.question_frame, text=question_data['question'], wraplength=550, font=("Arial", 14), bg="#f0f0f0", anchor="w")
-            question_label.pack(pady=10)
+        self.root.after(LOAD_POLL_MS, self.poll_load_queue)
 
-            self.check_vars = []  # Reset checkbox states for new question
-            for i, option in enumerate(question_data['options']):
-                var = tk.BooleanVar()  # Variable for the checkbox state
-                check_button = tk.Checkbutton(self.question_frame, text=option, variable=var, bg="#f0f0f0")
-                check_button.pack(anchor=tk.W, pady=5)
-                self.check_vars.append(var)  # Track the checkbox state
+    def cancel_loading(self):
+        """Ask the loading worker to stop; the poller cleans up once it has."""
+        if self.load_cancel:
+            self.load_cancel.set()
+            self.load_status_label.config(text="Cancelling...")
+
+    def end_loading(self):
+        """Hide the loading controls once the worker has finished."""
+        self.loading = False
+        self.load_button['state'] = tk.NORMAL
+        self.resume_button['state'] = tk.NORMAL
+        self.load_status_label.pack_forget()
+        self.cancel_button.pack_forget()
+
+    def start_journal(self, resumed):
+        """Journal the answers of the session that just started, flushing them on a timer."""
+        self.end_journal()
+        settings, seed, count = self.load_settings
+        session = self.session
+        if session.current() is None:
+            return  # Resumed with every question already answered
+        if getattr(session.order, 'store', None):
+            return  # The card store already keeps the progress of review sessions and drills
+        try:
+            if resumed:
+                self.journal = SessionJournal.reopen(SESSION_JOURNAL_PATH, session.bank.source_ids)
+            else:
+                self.journal = SessionJournal.create(SESSION_JOURNAL_PATH, settings, seed, count,
+                                                     getattr(session.order, 'first', None), len(session.order),
+                                                     session.bank.source_ids)
+                # The preview question may have been answered before the journal existed
+                for position, mask in enumerate(session.selections):
+                    question_id = session.order[position]
+                    self.journal.record(question_id, mask, mask == session.bank.answer_masks[question_id])
+        except (OSError, ValueError) as e:
+            messagebox.showwarning("Warning", f"Could not journal the session, so it can't be resumed: {e}")
+            self.journal = None
+            return
+        session.subscribe(self.journal.on_session_event)
+        self.journal_job = self.root.after(JOURNAL_FLUSH_MS, self.flush_journal)
+        self.update_resume_button()
+
+    def flush_journal(self):
+        """Write the answers given since the last flush, giving up on the journal if that fails."""
+        self.journal_job = None
+        try:
+            self.journal.flush()
+        except OSError as e:
+            messagebox.showwarning("Warning", f"Could not write the session journal, so it can't be resumed: {e}")
+            return
+        self.journal_job = self.root.after(JOURNAL_FLUSH_MS, self.flush_journal)
+
+    def end_journal(self, remove=False):
+        """Stop journaling, deleting the journal if the session is finished."""
+        if self.journal_job:
+            self.root.after_cancel(self.journal_job)
+            self.journal_job = None
+        if self.journal:
+            journal, self.journal = self.journal, None
+            try:
+                journal.close(remove)
+            except OSError as e:
+                messagebox.showwarning("Warning", f"Could not close the session journal: {e}")
+        self.update_resume_button()
+
+    def update_resume_button(self):
+        """Offer to resume the journaled session, unless it is finished or already running."""
+        try:
+            header = read_journal_header(SESSION_JOURNAL_PATH)
+        except (OSError, ValueError):
+            header = None
+        if header and not self.journal and header['answered'] < header['length']:
+            self.resume_button.config(text=f"Resume Session ({header['answered']} of {header['length']} answered)")
+            self.resume_button.pack(pady=5, after=self.load_button)
+        else:
+            self.resume_button.pack_forget()
+
+    def close_cards(self):
+        """Save and close the card store of a review session or adaptive drill."""
+        store = getattr(self.session.order, 'store', None)
+        if store:
+            try:
+                store.close()
+            except (OSError, ValueError) as e:
+                messagebox.showwarning("Warning", f"Could not save the review cards: {e}")
+
+    def show_answer_problems(self, problems):
+        """Warn that some answers can't be graded, and list them all in a window of their own."""
+        line, question_id, message = problems[0]
+        self.feedback_label.config(text=f"{len(problems)} question(s) can't be graded, e.g. line {line}: question {question_id + 1} {message}. "
+                                        "The full list is in the Answer Problems window.", bg="#FF9800")
+        window = tk.Toplevel(self.root)
+        window.title(f"Answer Problems ({len(problems)})")
+        window.geometry("700x400")
+        scrollbar = Scrollbar(window, orient="vertical")
+        text = tk.Text(window, wrap="none", font=self.body_font, yscrollcommand=scrollbar.set)
+        scrollbar.config(command=text.yview)
+        scrollbar.pack(side="right", fill="y")
+        text.pack(side="left", fill="both", expand=True)
+        text.insert(tk.END, "\n".join(f"Line {line}: question {question_id + 1} {message}"
+                                      for line, question_id, message in problems))
+        text.config(state=tk.DISABLED)
+
+    def show_bank_header(self, header):
+        """Show the size of a cached bank while its questions are decoded."""
+        average = header['options'] / header['records'] if header['records'] else 0
+        self.load_status_label.config(text=f"Loading {header['records']} questions ({average:.1f} options on average)...")
+        self.questions_left_label.config(text=f"Questions Left: {header['records']}")
+
+    def start_quiz(self, questions, order, answers=None):
+        """Reset the score and show the first question of a bank, asked in the given order.
+
+        answers, if given, are (question_id, mask) pairs replayed from a
+        journal; the quiz carries on after them.
+        """
+        self.cancel_advance()
+        self.end_journal()
+        self.close_cards()
+        self.session = QuizSession(questions, order)
+        if answers:
+            self.session.replay(answers)
+        if getattr(order, 'store', None):
+            self.session.subscribe(order.on_session_event)  # Reviews and drills learn from each answer
+        self.session.subscribe(self.on_session_event)
+        self.schedule_stats()
+        self.feedback_label.config(text="", bg="#f0f0f0")
+        self.session.start()
+
+    def reset_quiz(self):
+        """Go back to the empty state after a load failed or was cancelled."""
+        self.cancel_advance()
+        self.end_journal()
+        self.close_cards()
+        self.session = QuizSession(QuestionBank(), array('Q'))
+        self.schedule_stats()
+        self.show_message("Please load questions to start the quiz.")
+
+    def show_message(self, text, font=None):
+        """Hide the question widgets and show a message in their place."""
+        self.page.frame.pack_forget()
+        self.review_frame.pack_forget()
+        self.message_label.config(text=text, font=font or self.large_font)
+        self.message_label.pack(pady=20 if font else 10)
+
+    def on_session_event(self, event, *args):
+        """Show the changes reported by the quiz session."""
+        if event == 'answered':
+            self.show_feedback(*args)
+            self.schedule_stats()
+            self.root.after_idle(self.build_next)  # An adaptive drill picks the next question from this answer
+        else:
+            self.load_question()  # A new question is up, or the order ran out
+
+    def load_question(self):
+        """Load and display the current question and its options."""
+        session = self.session
+        question_id = session.current()
+        if question_id is not None:
+            start = time.perf_counter_ns()
+            if self.spare.holds(session.bank, question_id):
+                self.page, self.spare = self.spare, self.page  # Built while the last question was up
+                name = 'swap'
+            else:
+                self.event_counts['page_misses'] += 1
+                self.page.fill(session.bank, question_id)
+                name = 'build'
+            if not self.page.frame.winfo_manager():
+                self.message_label.pack_forget()  # Hide the message once questions are loaded
+                self.review_frame.pack_forget()
+                self.page.frame.pack(fill=tk.X)
+            self.spare.frame.pack_forget()
+            self.record_timing(name, start)
 
             self.next_button['state'] = tk.NORMAL
-            self.questions_left_label.config(text=f"Questions Left: {len(self.questions) - (self.current_question + 1)}")
-            self.message_label.pack_forget()  # Hide the message once questions are loaded
+            self.schedule_stats()
+
+            # Decode the next few questions once this one is on screen, and build the next page
+            upcoming = session.order[session.position + 1:session.position + 1 + PREFETCH_COUNT]
+            self.root.after_idle(session.bank.prefetch, upcoming)
+            self.root.after_idle(self.build_next)
 
-            self.update_progress_bar()
+        elif self.loading:
+            # The preview question was answered before the rest of the bank arrived
+            self.next_button['state'] = tk.DISABLED
+            self.show_message("Loading more questions...")
 
         else:
             self.finish_quiz()
 
+    def build_next(self):
+        """Build the next question in the hidden page while the user reads this one."""
+        session = self.session
+        position = session.position + 1
+        if position < len(session.order) and not self.spare.holds(session.bank, session.order[position]):
+            start = time.perf_counter_ns()
+            self.spare.fill(session.bank, session.order[position])
+            self.record_timing('build', start)
+
+    def record_timing(self, name, start):
+        """Record how long something took since start, a perf_counter_ns() reading."""
+        self.metrics.record(name, time.perf_counter_ns() - start)
+
     def check_answer(self):
         """Check the selected answer against the correct answer and update the score."""
-        if self.current_question < len(self.questions):
-            question_data = self.questions[self.current_question]
-            correct_answer = question_data['answer'].strip()
+        if self.advance_job:
+            self.advance()  # Submitting during the feedback pause skips the rest of it
+            return
 
-            # Collect selected answers based on checkbox states
-            selected_answers = [chr(65 + i) for i, var in enumerate(self.check_vars) if var.get()]  # A=65, B=66, etc.
-            selected_answer_string = ''.join(selected_answers)
+        if self.session.current() is not None:
+            self.session.answer(self.page.selected_mask())  # Feedback and stats follow from the 'answered' event
 
-            self.attempted += 1
-            self.attempted_label.config(text=f"Total Attempted: {self.attempted} | Total Incorrect: {self.incorrect} | Percentage Incorrect: {self.calculate_percentage():.2f}%")
-
-            if sorted(selected_answer_string) == sorted(correct_answer):
-                self.score += 1
-                self.correct += 1
-                messagebox.showinfo("Correct!", "Your answer is correct!")
+            if self.pause_var.get():
+                # Keep the answered question up, locked, until the delay runs out or Next is pressed again
+                for check_button in self.page.option_buttons[:self.page.shown_options]:
+                    check_button.config(state=tk.DISABLED)
+                self.advance_job = self.root.after(FEEDBACK_DELAY_MS, self.advance)
             else:
-                self.incorrect_answers.append(question_data['question'])
-                self.incorrect += 1
-                messagebox.showerror("Incorrect", f"Your answer is incorrect! The correct answer(s) is/are: {correct_answer}.")
+                self.advance()
 
-            self.score_label.config(text=f"Score: {self.score}")
-            self.current_question += 1
-            self.load_question()
+    def show_feedback(self, position, question_id, mask, correct):
+        """Show whether the answer to the question at position was right."""
+        if correct:
+            self.feedback_label.config(text=f"Question {position + 1}: Correct!", bg="#4CAF50")
+        else:
+            correct_answer = self.session.bank.answer(question_id).strip()
+            self.feedback_label.config(text=f"Question {position + 1}: Incorrect! The correct answer(s) is/are: {correct_answer}.", bg="#f44336")
 
-    def calculate_percentage(self):
-        """Calculate the percentage of incorrect answers."""
-        return (self.incorrect / self.attempted * 100) if self.attempted > 0 else 0
+    def advance(self):
+        """Move on to the next question."""
+        self.cancel_advance()
+        self.session.advance()
+
+    def cancel_advance(self):
+        """Drop a pending move to the next question."""
+        if self.advance_job:
+            self.root.after_cancel(self.advance_job)
+            self.advance_job = None
+
+    def on_key(self, event):
+        """Toggle the option row for the letter pressed."""
+        if isinstance(event.widget, tk.Entry) or self.advance_job:
+            return  # Typing into a prefix field, or the question is already answered
+        char = event.char.upper()
+        if len(char) == 1 and "A" <= char <= "Z":
+            index = ord(char) - 65
+            if index < self.page.shown_options:
+                var = self.page.check_vars[index]
+                var.set(not var.get())
+
+    def on_return(self, event):
+        """Submit the current answer, like pressing Next."""
+        if not isinstance(event.widget, tk.Entry) and str(self.next_button['state']) == tk.NORMAL:
+            self.check_answer()
 
     def finish_quiz(self):
         """Display the final score and percentage after quiz completion."""
-        for widget in self.question_frame.winfo_children():
-            widget.destroy()  # Clear the question frame
+        self.end_journal(remove=True)  # Nothing left to resume
+        self.save_results()
+        session = self.session
+        message = f"Quiz Finished!\nScore: {session.score}/{len(session.order)}\nPercentage: {session.percentage():.2f}%"
+        if isinstance(session.order, ReviewOrder):
+            due = session.order.scheduler.next_due()
+            if due is not None:
+                message += f"\nNext review due {time.strftime('%Y-%m-%d %H:%M', time.localtime(due * 60))}"
+        elif isinstance(session.order, AdaptiveOrder):
+            message += f"\nAbility: {session.order.store.ability:+.2f} (0 is a question of average difficulty)"
+        if getattr(session.order, 'store', None):
+            try:
+                session.order.store.flush()
+            except OSError as e:
+                messagebox.showwarning("Warning", f"Could not save the review cards: {e}")
+        self.show_message(message, self.result_font)
+        self.review_all_button.config(text=f"Review All Questions ({len(session.selections)})")
+        self.review_wrong_button.config(text=f"Review Wrong Answers ({len(session.incorrect_answers)})")
+        self.review_frame.pack(pady=10)
+
+    def save_results(self):
+        """Add the answers of the finished session to the file's results log, for item analysis."""
+        session = self.session
+        if self.load_settings is None or not session.selections:
+            return
+        settings = self.load_settings[0]
+        source_ids = session.bank.source_ids
+        responses = {}
+        for position, mask in enumerate(session.selections):
+            question_id = session.order[position]
+            if source_ids is not None:
+                question_id = source_ids[question_id]
+            responses.setdefault(question_id, mask)  # A question asked again in a review counts once
+        if isinstance(session.order, ReviewOrder):
+            mode = 'review'
+        elif isinstance(session.order, AdaptiveOrder):
+            mode = 'adaptive'
+        else:
+            mode = 'shuffled'
+        try:
+            append_results(results_path(settings['filename'], settings['question_prefix'],
+                                        settings['option_prefixes'], settings['answer_prefix']), responses.items(), mode)
+        except (OSError, ValueError) as e:
+            messagebox.showwarning("Warning", f"Could not save the session's results: {e}")
+
+    def show_review(self, wrong_only):
+        """Open a window listing the answered questions, or only the wrong ones."""
+        session = self.session
+        if wrong_only:
+            title, ids, selections = "Wrong Answers", session.incorrect_answers, session.incorrect_selections
+        else:
+            title, ids, selections = "All Questions", session.order, session.selections
+        window = tk.Toplevel(self.root)
+        window.title(f"Review: {title} ({len(selections)})")
+        window.geometry("700x500")
+        ReviewList(window, session.bank, ids, selections, self.body_font)
+
+    def schedule_scroll_region(self, event=None):
+        """Recompute the scroll region once the current burst of resizes is over."""
+        self.event_counts['configure'] += 1
+        if self.scroll_job is None:
+            self.scroll_job = self.root.after_idle(self.update_scroll_region)
 
-        total_questions = len(self.questions)
-        percentage = (self.score / total_questions * 100) if total_questions > 0 else 0
+    def update_scroll_region(self):
+        """Fit the scroll region to the frame's contents."""
+        self.scroll_job = None
+        self.event_counts['scroll_region'] += 1
+        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
 
-        final_label = tk.Label(self.question_frame, text=f"Quiz Finished!\nScore: {self.score}/{total_questions}\nPercentage: {percentage:.2f}%", font=("Arial", 16), bg="#f0f0f0")
-        final_label.pack(pady=20)
+    def schedule_stats(self):
+        """Refresh the score labels and progress bar once the current callback is done."""
+        self.event_counts['stats_changes'] += 1
+        if self.stats_job is None:
+            self.stats_job = self.root.after_idle(self.update_stats)
+
+    def update_stats(self):
+        """Show the score, attempts, questions left and progress in one pass."""
+        self.stats_job = None
+        self.event_counts['stats_updates'] += 1
+        session = self.session
+        self.score_label.config(text=f"Score: {session.score}")
+        self.attempted_label.config(text=f"Total Attempted: {session.attempted} | Total Incorrect: {session.incorrect} | Percentage Incorrect: {session.percentage_incorrect():.2f}%")
+        self.questions_left_label.config(text=f"Questions Left: {session.remaining()}")
+        self.update_progress_bar()
+
+    def toggle_debug_overlay(self, event=None):
+        """Show or hide the latency overlay in the top right corner."""
+        if self.debug_label.winfo_manager():
+            self.debug_label.place_forget()
+        else:
+            self.debug_label.place(relx=1.0, rely=0.0, anchor="ne")
+            self.refresh_debug_overlay()
+
+    def refresh_debug_overlay(self):
+        """Redraw the overlay while it is shown."""
+        if self.debug_label.winfo_manager():
+            counts = "  ".join(f"{name}={count}" for name, count in sorted(self.event_counts.items()))
+            self.debug_label.config(text=f"{self.metrics.report()}\n{counts}")
+            self.root.after(DEBUG_OVERLAY_MS, self.refresh_debug_overlay)
+
+    def close(self):
+        """Flush the session journal and review cards and, in debug mode, save the metrics, then close the window."""
+        self.end_journal()
+        self.close_cards()
+        if self.debug:
+            path = os.path.join(DEBUG_METRICS_DIR, f"metrics-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json")
+            try:
+                self.metrics.dump(path, self.event_counts)
+            except OSError as e:
+                print(f"Could not save debug metrics: {e}", file=sys.stderr)
+            else:
+                print(f"Debug metrics saved to {path}", file=sys.stderr)
+        self.root.destroy()
 
     def update_progress_bar(self):
         """Update the progress bar to reflect the attempted questions."""
-        total_questions = len(self.questions)
-        if total_questions > 0:
-            progress_width = (self.attempted / total_questions) * 200  # Scale the progress bar
+        if len(self.session.order) > 0:
+            progress_width = self.session.progress() * 200  # Scale the progress bar
             self.progress_canvas.coords(self.progress_rect, 0, 0, progress_width, 40)
 
+# Headless server: one bank in memory, many sessions over HTTP
+SERVER_PORT = 8000
+SERVER_CAPACITY = 10_000  # Sessions held at once, SESSION_RECORD.size bytes each
+SERVER_MAX_BODY = 4096  # Larger request bodies are refused
+SERVER_MAX_HEADER = 16384
+SERVER_READ_TIMEOUT = 30  # Seconds a connection may sit idle, or take to send a request, before it is closed
+SESSION_IDLE_SECONDS = 4 * 3600  # An idle session's slot may be reused after this long
+SESSION_RECORD = struct.Struct('<QQIIIfd')  # token, seed, questions, position, score, points, last active
+HTTP_REASONS = {200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+                405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+                500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class HTTPError(Exception):
+    """A request the server turns away, with its status code."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class SessionTable:
+    """Quiz sessions as fixed-size SESSION_RECORDs in one buffer, one slot each.
+
+    A session is named by its slot and a random token, which a slot gets
+    anew each time it is handed out, so a stale or guessed name finds
+    nothing. The questions come from a KeyedOrder of the seed, so the
+    record is all the state a session has. A token of 0 marks a free slot.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.records = bytearray(capacity * SESSION_RECORD.size)
+        self.free = array('I', range(capacity - 1, -1, -1))  # Low slots first
+
+    def __len__(self):
+        return self.capacity - len(self.free)
+
+    def create(self, seed, count, now):
+        """Start a session of count questions, returning its slot and token, or None when every slot is taken."""
+        if not self.free:
+            self.sweep(now)
+            if not self.free:
+                return None
+        slot = self.free.pop()
+        token = int.from_bytes(os.urandom(8), 'little') or 1
+        SESSION_RECORD.pack_into(self.records, slot * SESSION_RECORD.size, token, seed, count, 0, 0, 0.0, now)
+        return slot, token
+
+    def get(self, slot, token):
+        """Return the fields of a session as a list, or None if there is no such session."""
+        if not 0 <= slot < self.capacity:
+            return None
+        fields = list(SESSION_RECORD.unpack_from(self.records, slot * SESSION_RECORD.size))
+        return fields if fields[0] == token and token else None
+
+    def put(self, slot, fields):
+        SESSION_RECORD.pack_into(self.records, slot * SESSION_RECORD.size, *fields)
+
+    def remove(self, slot):
+        SESSION_RECORD.pack_into(self.records, slot * SESSION_RECORD.size, 0, 0, 0, 0, 0, 0.0, 0.0)
+        self.free.append(slot)
+
+    def sweep(self, now):
+        """Free the slots of sessions idle for longer than SESSION_IDLE_SECONDS."""
+        for slot in range(self.capacity):
+            token, *_, active = SESSION_RECORD.unpack_from(self.records, slot * SESSION_RECORD.size)
+            if token and now - active > SESSION_IDLE_SECONDS:
+                self.remove(slot)
+
+class QuizServer:
+    """HTTP/1.1 server for quiz sessions over one shared bank, on asyncio.
+
+    The bank is loaded once and each question's JSON is encoded the first
+    time it is asked for, then reused by every session. Requests are small
+    and handled in one go on the event loop, so one process serves
+    thousands of sessions; request times, from the end of the headers to
+    the response being queued, are kept in a LatencyHistogram.
+
+        GET    /                        the number of questions
+        POST   /sessions                start a session: {"count": n, "seed": s}, both optional
+        GET    /sessions/<id>           its score and current question
+        POST   /sessions/<id>/answer    {"answer": "A, C"} or {"options": [0, 2]}, and
+                                        optionally the "position" answered, to refuse a repeat
+        DELETE /sessions/<id>           end it
+        GET    /stats                   sessions held and request latency
+    """
+
+    def __init__(self, bank, policy=all_or_nothing, capacity=SERVER_CAPACITY):
+        self.bank = bank
+        self.policy = policy
+        self.sessions = SessionTable(capacity)
+        self.payloads = [None] * len(bank)  # Question id -> encoded JSON of the question
+        self.latency = LatencyHistogram()
+
+    def question_payload(self, question_id):
+        payload = self.payloads[question_id]
+        if payload is None:
+            payload = self.payloads[question_id] = json.dumps({
+                'id': question_id,
+                'question': self.bank.question(question_id),
+                'options': self.bank.options(question_id),
+            }).encode('utf-8')
+        return payload
+
+    def session_payload(self, slot, fields, extra=None):
+        """Encode a session's state and current question, spliced in from its cached JSON."""
+        token, seed, count, position, score, points, _ = fields
+        state = {'session': f"{slot:x}-{token:016x}", 'count': count, 'position': position, 'score': score,
+                 'points': round(points, 4), 'finished': position >= count}
+        if extra:
+            state.update(extra)
+        body = json.dumps(state).encode('utf-8')
+        question = self.question_payload(KeyedOrder(len(self.bank), seed)[position]) if position < count else b'null'
+        return body[:-1] + b', "question": ' + question + b'}'
+
+    def find(self, name):
+        """Return the slot and fields of the session named name."""
+        slot, _, token = name.partition('-')
+        try:
+            slot, token = int(slot, 16), int(token, 16)
+        except ValueError:
+            raise HTTPError(404, "No such session.") from None
+        fields = self.sessions.get(slot, token)
+        if fields is None:
+            raise HTTPError(404, "No such session.")
+        return slot, fields
+
+    def handle(self, method, path, body):
+        """Answer a request, returning the status and the JSON body."""
+        parts = path.split('?', 1)[0].strip('/').split('/')
+        now = time.monotonic()
+        if parts == ['']:
+            return 200, json.dumps({'questions': len(self.bank)}).encode('utf-8')
+        if parts == ['stats']:
+            return 200, json.dumps({'sessions': len(self.sessions), 'capacity': self.sessions.capacity,
+                                    'requests': self.latency.summary()}).encode('utf-8')
+        if parts[0] != 'sessions' or len(parts) > 3:
+            raise HTTPError(404, "Not found.")
+
+        if len(parts) == 1:
+            if method != 'POST':
+                raise HTTPError(405, "Use POST to start a session.")
+            request = self.read_json(body)
+            count = request.get('count', len(self.bank))
+            seed = request.get('seed', random.getrandbits(64))
+            # JSON true and false load as bool, which is an int too
+            if type(count) is not int or type(seed) is not int or count < 1 or not 0 <= seed < 1 << 64:
+                raise HTTPError(400, "count must be a positive integer and seed an unsigned 64-bit one.")
+            created = self.sessions.create(seed, min(count, len(self.bank)), now)
+            if created is None:
+                raise HTTPError(503, "Every session slot is taken. Try again later.")
+            slot, _ = created
+            return 201, self.session_payload(slot, self.sessions.get(*created))
+
+        slot, fields = self.find(parts[1])
+        if len(parts) == 2:
+            if method == 'DELETE':
+                self.sessions.remove(slot)
+                return 204, b''
+            if method != 'GET':
+                raise HTTPError(405, "Use GET or DELETE on a session.")
+            fields[6] = now
+            self.sessions.put(slot, fields)
+            return 200, self.session_payload(slot, fields)
+
+        if parts[2] != 'answer':
+            raise HTTPError(404, "Not found.")
+        if method != 'POST':
+            raise HTTPError(405, "Use POST to answer.")
+        request = self.read_json(body)
+        token, seed, count, position, score, points, _ = fields
+        if position >= count:
+            raise HTTPError(409, "The session is finished.")
+        if request.get('position', position) != position:
+            raise HTTPError(409, f"Question {request['position']} is already answered; the session is at {position}.")
+        mask = self.read_mask(request)
+        question_id = KeyedOrder(len(self.bank), seed)[position]
+        expected = self.bank.answer_masks[question_id]
+        correct = mask == expected
+        # The default policy needs no call: a right answer is one point
+        points += correct if self.policy is all_or_nothing else self.policy(mask, expected)
+        fields = [token, seed, count, position + 1, score + correct, points, now]
+        self.sessions.put(slot, fields)
+        return 200, self.session_payload(slot, fields, {'correct': correct, 'answer': self.bank.answer(question_id).strip()})
+
+    @staticmethod
+    def read_json(body):
+        try:
+            request = json.loads(body) if body else {}
+        except ValueError:
+            raise HTTPError(400, "The body is not valid JSON.") from None
+        if not isinstance(request, dict):
+            raise HTTPError(400, "The body must be a JSON object.")
+        return request
+
+    @staticmethod
+    def read_mask(request):
+        """Return the mask of the options selected in an answer request."""
+        if 'options' in request:
+            options = request['options']
+            if not isinstance(options, list) or not all(type(o) is int and 0 <= o < 26 for o in options):
+                raise HTTPError(400, "options must be a list of option indexes from 0.")
+            return sum(1 << option for option in set(options))
+        answer = request.get('answer')
+        if not isinstance(answer, str) or answer_mask(answer) == INVALID_ANSWER:
+            raise HTTPError(400, 'Give the answer as "answer": "A, C" or "options": [0, 2].')
+        return answer_mask(answer)
+
+    async def serve_connection(self, reader, writer):
+        """Answer the requests of one connection until the client closes it or asks to.
+
+        A client that sends nothing, or stalls partway through a request, for
+        SERVER_READ_TIMEOUT seconds has its connection aborted, which ends the
+        pending read.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None
+        try:
+            while True:
+                # A timer, as asyncio.wait_for would make each read a task and a pass of the event loop
+                deadline = loop.call_later(SERVER_READ_TIMEOUT, writer.transport.abort)
+                head = await reader.readuntil(b'\r\n\r\n')
+                start = time.perf_counter_ns()
+                request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+                method, path, version = request_line.split(' ', 2)
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get('content-length') or '0'
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                try:
+                    if not (length.isascii() and length.isdigit()):
+                        keep_alive = False  # Where the body ends is unknown
+                        raise HTTPError(400, "Content-Length must be a non-negative integer.")
+                    if len(length) > 18 or int(length) > SERVER_MAX_BODY:
+                        keep_alive = False  # The body is left unread
+                        raise HTTPError(413, "The request body is too large.")
+                    length = int(length)
+                    body = await reader.readexactly(length) if length else b''
+                    deadline.cancel()
+                    status, payload = self.handle(method, path, body)
+                except asyncio.IncompleteReadError:
+                    raise  # The client went away or stalled mid-body: drop the connection, below
+                except HTTPError as e:
+                    status, payload = e.status, json.dumps({'error': str(e)}).encode('utf-8')
+                except Exception as e:
+                    print(f"quiz.py serve: {method} {path}: {e!r}", file=sys.stderr)
+                    status, payload = 500, json.dumps({'error': "Internal error."}).encode('utf-8')
+                head = (f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                        f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n")
+                if not keep_alive:
+                    head += "Connection: close\r\n"
+                writer.write(f"{head}\r\n".encode('latin-1') + payload)
+                self.latency.record(time.perf_counter_ns() - start)
+                if not keep_alive:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass  # The client went away or stalled, or sent something that isn't HTTP
+        finally:
+            if deadline is not None:
+                deadline.cancel()
+            writer.close()
+
+    async def serve(self, host, port, on_ready=None):
+        """Serve on host and port until cancelled; on_ready, if given, is called with the listening server."""
+        server = await asyncio.start_server(self.serve_connection, host, port, limit=SERVER_MAX_HEADER,
+                                            backlog=1024)
+        if on_ready:
+            on_ready(server)
+        async with server:
+            await server.serve_forever()
+
+def add_bank_arguments(parser):
+    """Add the question file and prefix arguments the command line entry points share."""
+    parser.add_argument("filename", help="question file")
+    parser.add_argument("--question-prefix", default=DEFAULT_QUESTION_PREFIX)
+    parser.add_argument("--option-prefixes", default=DEFAULT_OPTION_PREFIXES, help="comma separated")
+    parser.add_argument("--answer-prefix", default=DEFAULT_ANSWER_PREFIX)
+
+def parse_bank_arguments(args):
+    """Parse the question file named on the command line in file order, returning it and the option prefixes."""
+    option_prefixes = [prefix.strip() for prefix in args.option_prefixes.split(',')]
+    bank = parse_questions(args.filename, args.question_prefix, option_prefixes, args.answer_prefix)
+    if not len(bank):
+        raise ValueError("No questions found in the file. Please check the file format.")
+    return bank, option_prefixes
+
+def open_output(path):
+    """Open a CSV file to write, or standard output for "-"."""
+    return open(path, 'w', newline='', encoding='utf-8') if path != "-" else standard_output()
+
+def analyze_main(argv):
+    """Command line: item statistics for a question file from the results of past sessions."""
+    parser = argparse.ArgumentParser(prog="quiz.py analyze",
+                                     description="Item statistics for a question file, from the results of past sessions.")
+    add_bank_arguments(parser)
+    parser.add_argument("--results", help="results log to read (default: the one the app keeps for the file)")
+    parser.add_argument("--output", "-o", default="-", help="CSV file to write (default: standard output)")
+    parser.add_argument("--all", action="store_true", help="report every question, not just the flagged ones")
+    parser.add_argument("--modes", default=",".join(FIXED_FORM_MODES),
+                        help=f"comma separated session modes to analyse, of {', '.join(RESULT_MODES)} "
+                             f"(default: the fixed-form ones)")
+    args = parser.parse_args(argv)
+    modes = [mode.strip() for mode in args.modes.split(',')]
+
+    try:
+        unknown = [mode for mode in modes if mode not in RESULT_MODES]
+        if unknown:
+            raise ValueError(f"Unknown session mode {unknown[0]!r}, expected one of {', '.join(RESULT_MODES)}")
+        bank, option_prefixes = parse_bank_arguments(args)
+        results = args.results or results_path(args.filename, args.question_prefix, option_prefixes, args.answer_prefix)
+        start = time.perf_counter()
+        stats = item_analysis(bank, *select_results(*read_results(results), modes))
+        flagged = flag_items(bank, stats)
+        elapsed = time.perf_counter() - start
+        question_ids = range(len(bank)) if args.all else [question_id for question_id, _ in flagged]
+        with open_output(args.output) as file:
+            write_item_report(file, bank, stats, question_ids, dict(flagged))
+    except (OSError, ValueError) as e:
+        print(f"quiz.py analyze: {e}", file=sys.stderr)
+        return 1
+    print(f"{stats['students']:,} students x {len(bank):,} questions analysed in {elapsed:.2f} s, "
+          f"{len(flagged):,} flagged", file=sys.stderr)
+    return 0
+
+def grade_main(argv):
+    """Command line: grade CSV answer sheets against a question file's answers."""
+    parser = argparse.ArgumentParser(prog="quiz.py grade",
+                                     description="Grade CSV answer sheets (student id, then one answer per question "
+                                                 "in file order) against a question file's answers.")
+    add_bank_arguments(parser)
+    parser.add_argument("sheets", help="CSV of answer sheets, one per line")
+    parser.add_argument("--output", "-o", default="-", help="CSV of scores per student (default: standard output)")
+    parser.add_argument("--stats", help="CSV of statistics per question")
+    parser.add_argument("--policy", choices=sorted(SCORING_POLICIES), default='all-or-nothing',
+                        help="how points are given for multiple-answer questions")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=GRADE_BATCH_SIZE, help="sheets per worker task")
+    parser.add_argument("--header", action=argparse.BooleanOptionalAction, default=True,
+                        help="whether the first line of the sheets is a header (default: it is)")
+    args = parser.parse_args(argv)
+
+    try:
+        bank, _ = parse_bank_arguments(args)
+        for line, question_id, message in bank.problems:
+            print(f"Line {line}: question {question_id + 1} {message}", file=sys.stderr)
+        start = time.perf_counter()
+        with open(args.sheets, newline='', encoding='utf-8-sig') as sheets, open_output(args.output) as file:
+            writer = csv.writer(file)
+            writer.writerow(["student", "score", "points", "percentage", "answered", "unreadable"])
+
+            def write_sheets(graded):
+                writer.writerows((student, score, f"{points:g}", f"{score / len(bank) * 100:.2f}", answered, unreadable)
+                                 for student, score, points, answered, unreadable in graded)
+
+            def report_skipped(line, reason):
+                print(f"{args.sheets}, line {line}: skipped {reason}", file=sys.stderr)
+
+            count, selections = grade_sheets(bank, sheets, write_sheets, args.policy, args.workers, args.batch_size,
+                                             args.header, report_skipped)
+        elapsed = time.perf_counter() - start
+        if args.stats:
+            with open_output(args.stats) as file:
+                write_grade_stats(file, bank, count, selections)
+    except (OSError, ValueError) as e:
+        print(f"quiz.py grade: {e}", file=sys.stderr)
+        return 1
+    print(f"Graded {count:,} sheets of {len(bank):,} questions in {elapsed:.2f} s "
+          f"({count / elapsed if elapsed else 0:,.0f} sheets/sec)", file=sys.stderr)
+    return 0
+
+def rescore_main(argv):
+    """Command line: rescore the results of past sessions against a question file's current answers."""
+    parser = argparse.ArgumentParser(prog="quiz.py rescore",
+                                     description="Rescore the results of past sessions against a question file's "
+                                                 "current answers, after a key is fixed or to try another policy.")
+    add_bank_arguments(parser)
+    parser.add_argument("--results", help="results log to read (default: the one the app keeps for the file)")
+    parser.add_argument("--policy", choices=sorted(ARRAY_SCORING_POLICIES), default='all-or-nothing',
+                        help="how points are given for multiple-answer questions")
+    parser.add_argument("--output", "-o", default="-", help="CSV of scores per student (default: standard output)")
+    args = parser.parse_args(argv)
+
+    try:
+        bank, option_prefixes = parse_bank_arguments(args)
+        if numpy is None:
+            raise ValueError("Rescoring needs NumPy. Install it with: pip install numpy")
+        results = args.results or results_path(args.filename, args.question_prefix, option_prefixes, args.answer_prefix)
+        scores, changed, rescored = rescore_results(bank, results, args.policy)
+        with open_output(args.output) as file:
+            writer = csv.writer(file)
+            writer.writerow(["student", "asked", "points", "percentage"])
+            for student, (points, asked) in enumerate(zip(scores.totals.tolist(), scores.asked.tolist())):
+                if asked:
+                    writer.writerow([student, asked, f"{points:g}", f"{points / asked * 100:.2f}"])
+    except (OSError, ValueError) as e:
+        print(f"quiz.py rescore: {e}", file=sys.stderr)
+        return 1
+    if changed is None:
+        print(f"Scored {scores.records:,} responses of {len(scores.totals):,} students", file=sys.stderr)
+    else:
+        print(f"Answers changed for {changed:,} questions, {rescored:,} of {scores.records:,} responses rescored",
+              file=sys.stderr)
+    return 0
+
+def serve_main(argv):
+    """Command line: serve quiz sessions over HTTP from one question file."""
+    parser = argparse.ArgumentParser(prog="quiz.py serve",
+                                     description="Serve quiz sessions over HTTP, with JSON questions and answers, "
+                                                 "from one question file loaded once.")
+    add_bank_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--policy", choices=sorted(SCORING_POLICIES), default='all-or-nothing',
+                        help="how points are given for multiple-answer questions")
+    parser.add_argument("--capacity", type=int, default=SERVER_CAPACITY, help="sessions held at once")
+    args = parser.parse_args(argv)
+    option_prefixes = [prefix.strip() for prefix in args.option_prefixes.split(',')]
+
+    try:
+        bank = load_questions_cached(args.filename, args.question_prefix, option_prefixes, args.answer_prefix)
+        if not len(bank):
+            raise ValueError("No questions found in the file. Please check the file format.")
+        server = QuizServer(bank, SCORING_POLICIES[args.policy], args.capacity)
+        on_ready = lambda listening: print(f"Serving {len(bank):,} questions on http://{args.host}:{args.port}",
+                                           file=sys.stderr)
+        asyncio.run(server.serve(args.host, args.port, on_ready))
+    except (OSError, ValueError) as e:
+        print(f"quiz.py serve: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+@contextmanager
+def standard_output():
+    """Standard output as a context manager that leaves it open."""
+    yield sys.stdout
+
+COMMANDS = {
+    'analyze': analyze_main,
+    'grade': grade_main,
+    'rescore': rescore_main,
+    'serve': serve_main,
+}
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # PDF extraction workers in the frozen executable
+    if sys.argv[1:2] and sys.argv[1] in COMMANDS:
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
+    if tk is None:
+        sys.exit(f"quiz.py: the quiz window needs Tk, which this Python lacks. Commands: {', '.join(COMMANDS)}")
     root = tk.Tk()
-    app = QuizApp(root)
+    app = QuizApp(root, debug="--debug" in sys.argv[1:] or bool(os.environ.get("QUIZAPP_DEBUG")))
     root.mainloop()